@@ -0,0 +1,78 @@
+import argparse
+import time
+from glob import glob
+from os import path
+
+import numpy as np
+import pandas as pd
+
+# append current directory to sys path
+import sys
+sys.path.insert(0, '.')
+from polaris_motor_data_extraction.data_extractors import WindowStatsExtractor, polaris_columns_of
+
+
+# the straightforward pandas implementation of WindowStatsExtractor, used as a reference
+def _naive_window_stats(extractor, gripper_df):
+    n = len(gripper_df)
+    closure_ind = int(np.argmin(gripper_df['gripper_motor_2'].values))
+    centers = [min(max(closure_ind + o, 0), n - 1) for o in extractor.offsets]
+
+    def _slope(y):
+        if len(y) < 2:
+            return 0.0
+        return np.polyfit(np.arange(len(y)), y, 1)[0]
+
+    features = {}
+    for w in extractor.window_sizes:
+        rolling = gripper_df[extractor.columns].rolling(w, center=True, min_periods=1)
+        stats = {'mean': rolling.mean(), 'min': rolling.min(), 'max': rolling.max(),
+                 'slope': rolling.apply(_slope, raw=True)}
+        for o, center in zip(extractor.offsets, centers):
+            for stat in extractor.STATS:
+                for c in extractor.columns:
+                    features['{}_w{}_o{}_{}'.format(c, w, o, stat)] = stats[stat][c].iloc[center]
+
+    return features
+
+
+def _random_gripper_dfs(num_grasps, num_records, seed=0):
+    rng = np.random.RandomState(seed)
+    columns = WindowStatsExtractor().columns
+    return [pd.DataFrame(np.cumsum(rng.randn(num_records, len(columns)), axis=0), columns=columns)
+            for _ in range(num_grasps)]
+
+
+def _time(f, gripper_dfs):
+    start = time.perf_counter()
+    results = [f(df) for df in gripper_dfs]
+    return time.perf_counter() - start, results
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Benchmark window stats extractor against a naive pandas version')
+    # gripper data produced by index_dataset.py, random walks are generated if not given
+    parser.add_argument('--data-folderpath', action='store', type=str, default=None)
+    parser.add_argument('--num-grasps', action='store', type=int, default=20)
+    parser.add_argument('--num-records', action='store', type=int, default=500)
+
+    args = parser.parse_args()
+
+    if args.data_folderpath is not None:
+        filepaths = sorted(glob(path.join(args.data_folderpath, 'gripper_data', '*.csv')))[:args.num_grasps]
+        gripper_dfs = [pd.read_csv(fp) for fp in filepaths]
+        extractor = WindowStatsExtractor(polaris_columns=polaris_columns_of(filepaths[0]))
+    else:
+        gripper_dfs = _random_gripper_dfs(args.num_grasps, args.num_records)
+        extractor = WindowStatsExtractor()
+
+    fast_seconds, fast_results = _time(extractor.call, gripper_dfs)
+    naive_seconds, naive_results = _time(lambda df: _naive_window_stats(extractor, df), gripper_dfs)
+
+    max_abs_diff = max(abs(fast[k] - naive[k]) for fast, naive in zip(fast_results, naive_results) for k in fast)
+
+    print('{} grasps, {} features per grasp'.format(len(gripper_dfs), len(extractor.feature_names)))
+    print('window_stats_extractor: {:.4f}s, naive pandas: {:.4f}s, speedup {:.1f}x'
+          .format(fast_seconds, naive_seconds, naive_seconds / fast_seconds))
+    print('max absolute difference: {:.3g}'.format(max_abs_diff))
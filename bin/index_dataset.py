@@ -1,6 +1,7 @@
 import argparse
 import logging
 import os
+import time
 from functools import reduce, partial
 from glob import glob
 from os import path
@@ -16,10 +17,20 @@ import numpy as np
 import sys
 sys.path.insert(0, '.')
 
+from grasp_dataset.index import GraspIndex, Selection, BINARY_INDEX_FILENAME
+from grasp_dataset.previews import PreviewWriter, IMAGES
+from grasp_dataset.stats import DatasetStats, STATS_FILENAME
+from grasp_dataset.sharding import parse_shard, in_shard, shard_mask, shard_dirname, write_shard_manifest
+from grasp_dataset.verification import VerificationReport, VERIFICATION_FILENAME, VERIFIED_MERGE_MODE, \
+    VERIFIED_ORIENTATION, legacy_transform, legacy_interpolate, merged_frame_deviations
+from grasp_dataset.watch import GraspFileWatcher
 from parsers import polaris_coord_transform
+from parsers.clock_offset import estimate_clock_offset
 from parsers.daily_origins_parser import parse_daily_origin
 from parsers.gripper_parser import parse_gripper_file
+from parsers.polaris_interp import timestamps_to_ns, bracket, interpolate_tool_params
 from parsers.polaris_parser import parse_polaris_file
+from parsers.polaris_quality import gate_polaris_frames
 
 
 def _extract_session_id_from_gripper_filepath(fp):
@@ -36,18 +47,20 @@ def _grasp_id_from_filepath(split, fp):
     return int(path.basename(fp).split(split)[0])
 
 
+# filetype_name => (extension, a function to extract grasp id from filename)
+_FILETYPES = {'gripper_filepath': ('*displacement', partial(_grasp_id_from_filepath, '-')),
+              'polaris_filepath': ('*.txt', partial(_grasp_id_from_filepath, '-')),
+              'rs_depth_image_filepath': ('*RS_depth.npy', partial(_grasp_id_from_filepath, '_')),
+              'rs_color_image_filepath': ('*RS_color.npy', partial(_grasp_id_from_filepath, '_')),
+              'zed_depth_image_filepath': ('*ZED_depth.npy', partial(_grasp_id_from_filepath, '_')),
+              'zed_color_image_filepath': ('*ZED_color.npy', partial(_grasp_id_from_filepath, '_'))}
+
+
 # list all files (gripper files, polaris files, image files, etc) and join them by grasp id
 def _group_files_by_grasp_id(input_folderpath):
-    # filetype_name => (extension, a function to extract grasp id from filename)
-    filetypes = {'gripper_filepath': ('*displacement', partial(_grasp_id_from_filepath, '-')),
-                 'polaris_filepath': ('*.txt', partial(_grasp_id_from_filepath, '-')),
-                 'rs_depth_image_filepath': ('*RS_depth.npy', partial(_grasp_id_from_filepath, '_')),
-                 'rs_color_image_filepath': ('*RS_color.npy', partial(_grasp_id_from_filepath, '_')),
-                 'zed_depth_image_filepath': ('*ZED_depth.npy', partial(_grasp_id_from_filepath, '_')),
-                 'zed_color_image_filepath': ('*ZED_color.npy', partial(_grasp_id_from_filepath, '_'))}
     filepath_dfs = []
 
-    for filetype, (ext, extract_grasp_id) in filetypes.items():
+    for filetype, (ext, extract_grasp_id) in _FILETYPES.items():
         # find all filepaths with the same extension
         filepaths = []
         for dir in os.walk(input_folderpath):  # recursively walks all directories
@@ -70,28 +83,51 @@ def _group_files_by_grasp_id(input_folderpath):
 
 
 # join gripper records and polaris records by timestamp
-def _merge_polaris_gripper(polaris_ts, polaris_records, gripper_motor_interps):
-    gripper_motor_records = np.zeros(shape=(len(polaris_ts), 4))
+def _merge_polaris_gripper(polaris_ts, polaris_records, gripper_motor_interps, orientation='axis_angle'):
+    # evaluate each interpolation at all polaris timestamps at once
+    polaris_ts_values = timestamps_to_ns(polaris_ts)
+    gripper_motor_records = np.column_stack([f(polaris_ts_values) for f in gripper_motor_interps])
+
+    return _make_merged_df(polaris_ts, gripper_motor_records, polaris_records, orientation)
+
+
+def _align_polaris_to_gripper(gripper_ts, gripper_motor_records, polaris_ts, tool1_params, tool2_params):
+    """Interpolates polaris tool parameters at gripper timestamps, i.e. the reverse of _merge_polaris_gripper
+    gripper records outside the time span of polaris recording are dropped
+
+    :return: (timestamps, gripper motor records, tool1 params, tool2 params) aligned to gripper timestamps
+    """
+    gripper_ts_values = timestamps_to_ns(gripper_ts)
+    i0, i1, alpha, in_range = bracket(timestamps_to_ns(polaris_ts), gripper_ts_values)
+
+    if not np.any(in_range):
+        raise ValueError('no gripper record falls within polaris recording')
+
+    i0, i1, alpha = i0[in_range], i1[in_range], alpha[in_range]
 
-    for i, ts in enumerate(polaris_ts):
-        ts_value = ts.value
-        gripper_motor_record = np.array([f(ts_value) for f in gripper_motor_interps])
+    return (gripper_ts[in_range],
+            gripper_motor_records[in_range],
+            interpolate_tool_params(tool1_params, i0, i1, alpha),
+            interpolate_tool_params(tool2_params, i0, i1, alpha))
 
-        gripper_motor_records[i] = gripper_motor_record
 
-    return pd.DataFrame({
-        'timestamp': polaris_ts,
+# build the merged dataframe of gripper motor and polaris records sharing the same timestamps,
+# polaris records are positions followed by orientations in the given representation
+def _make_merged_df(ts, gripper_motor_records, polaris_records, orientation='axis_angle'):
+    orientation_columns, _ = polaris_coord_transform.ORIENTATION_REPRESENTATIONS[orientation]
+    polaris_columns = ['polaris_x', 'polaris_y', 'polaris_z'] + ['polaris_' + c for c in orientation_columns]
+
+    merged_df = pd.DataFrame({
+        'timestamp': ts,
         'gripper_motor_1': gripper_motor_records[:, 0],
         'gripper_motor_2': gripper_motor_records[:, 1],
         'gripper_motor_3': gripper_motor_records[:, 2],
-        'gripper_motor_4': gripper_motor_records[:, 3],
-        'polaris_x': polaris_records[:, 0],
-        'polaris_y': polaris_records[:, 1],
-        'polaris_z': polaris_records[:, 2],
-        'polaris_rx': polaris_records[:, 3],
-        'polaris_ry': polaris_records[:, 4],
-        'polaris_rz': polaris_records[:, 5]
+        'gripper_motor_4': gripper_motor_records[:, 3]
     })
+    for ci, c in enumerate(polaris_columns):
+        merged_df[c] = polaris_records[:, ci]
+
+    return merged_df
 
 
 # produces spline interpolations with gripper records, i.e. f[i](timestamp) => gripper_motor_params[i]
@@ -120,46 +156,233 @@ def _save_gripper_data(grasp_id, gripper_df, output_folderpath):
     return gripper_data_filepath
 
 
-if __name__ == '__main__':
-    # parse command line arguments
-    parser = argparse.ArgumentParser(description='Index gripper data')
-    parser.add_argument('--input-folderpath', action='store', type=str, required=True)
-    parser.add_argument('--output-folderpath', action='store', type=str, required=True)
-    parser.add_argument('--update-origin', action='store_true', default=False)
-    parser.add_argument('--daily-origin-filepath', action='store', type=str,
-                        default='Data Collection - DailyOrigin.csv')
-    parser.add_argument('--transformation-constants-filepath', action='store', type=str,
-                        default='transformation.constants')
-    parser.add_argument('--log-filename', action='store', type=str, default='log.txt')
-    parser.add_argument('--limit-processing', action='store', type=int, default=None)
+def _refine_clock_offset(parsed_gripper_file, parsed_polaris_file, polaris_coord_transformer, args):
+    """Shifts gripper timestamps by the residual clock offset estimated from the data, see estimate_clock_offset,
+    if the estimate is confident enough; gripper files without time difference are first aligned coarsely by
+    the first records of both recordings, polaris motion is that of the gripper center, which unlike the tool
+    positions does not jump when the recorded tool switches between 449 and 339
 
-    args = parser.parse_args()
-
-    # setupt file logging
-    logging.basicConfig(filename=args.log_filename, filemode='w', level=logging.DEBUG)
-
-    # prepare polaris coordinate transformer
-    print('prepare polaris coords transformations...')
-    polaris_coord_transform_constants = polaris_coord_transform.ndi_transformation(args.transformation_constants_filepath)
-    polaris_coord_transformer = polaris_coord_transform.Transformer(polaris_coord_transform_constants)
-
-    # prepare daily origins for coordinate transformation
+    :return: (a ParsedGripperFile with refined timestamps, a dict of clock offset statistics)
+    """
+    gripper_ts = parsed_gripper_file.timestamps
+    if parsed_gripper_file.time_delta is None:
+        gripper_ts = gripper_ts + (parsed_polaris_file.timestamps[0] - gripper_ts[0])
+
+    polaris_positions = polaris_coord_transformer.transform_batch(parsed_polaris_file.tool1_params,
+                                                                  parsed_polaris_file.tool2_params)[:, 0:3]
+
+    offset, confidence = estimate_clock_offset(gripper_ts, parsed_gripper_file.motor_records[:, 1],
+                                               parsed_polaris_file.timestamps, polaris_positions,
+                                               max_offset_seconds=args.clock_offset_window)
+
+    is_applied = confidence >= args.clock_offset_min_confidence
+    if is_applied:
+        gripper_ts = gripper_ts + pd.Timedelta(offset, unit='ns')
+    elif parsed_gripper_file.time_delta is None:
+        raise ValueError('time difference is not found in gripper file and clock offset estimate is not confident, '
+                         'confidence {:.3f}'.format(confidence))
+
+    stats = {
+        'clock_offset_ms': offset / 1e6,
+        'clock_offset_confidence': confidence,
+        'clock_offset_applied': is_applied
+    }
+
+    return parsed_gripper_file._replace(timestamps=gripper_ts), stats
+
+
+def _verify_against_legacy(grasp_id, parsed_gripper_file, parsed_polaris_file, polaris_coord_transformer,
+                           verification_report):
+    """Merges gripper and polaris recordings at polaris timestamps with axis angle orientations with both the
+    legacy and the fast path, and adds their timings and deviations to verification_report, the legacy path has
+    neither --merge-mode gripper nor other orientations
+    """
+    legacy_seconds = {}
+    fast_seconds = {}
+
+    try:
+        start = time.time()
+        legacy_polaris_records = legacy_transform(polaris_coord_transformer,
+                                                  parsed_polaris_file.tool1_params,
+                                                  parsed_polaris_file.tool2_params)
+        legacy_seconds['transform'] = time.time() - start
+
+        start = time.time()
+        legacy_motor_records = legacy_interpolate(parsed_gripper_file.timestamps,
+                                                  parsed_gripper_file.motor_records,
+                                                  parsed_polaris_file.timestamps)
+        legacy_seconds['interpolate'] = time.time() - start
+    except ValueError as e:
+        logging.warning('legacy path failed verifying grasp %s: %s', grasp_id, e)
+        verification_report.add_legacy_failure(grasp_id, e)
+        return
+
+    start = time.time()
+    fast_polaris_records = polaris_coord_transformer.transform_batch(parsed_polaris_file.tool1_params,
+                                                                     parsed_polaris_file.tool2_params,
+                                                                     orientation=VERIFIED_ORIENTATION)
+    fast_seconds['transform'] = time.time() - start
+
+    start = time.time()
+    gripper_motor_interps = _gripper_motor_records_to_interps(parsed_gripper_file.timestamps,
+                                                              parsed_gripper_file.motor_records)
+    fast_df = _merge_polaris_gripper(parsed_polaris_file.timestamps, fast_polaris_records, gripper_motor_interps,
+                                     orientation=VERIFIED_ORIENTATION)
+    fast_seconds['interpolate'] = time.time() - start
+
+    legacy_df = _make_merged_df(parsed_polaris_file.timestamps, legacy_motor_records, legacy_polaris_records)
+    deviations = merged_frame_deviations(legacy_df, fast_df)
+
+    if not verification_report.add(grasp_id, legacy_seconds, fast_seconds, deviations):
+        logging.warning('grasp %s deviates from the legacy path beyond tolerances: %s', grasp_id, deviations)
+
+
+def _process_grasp(r, args, selection, polaris_coord_transformer, daily_origins, output_folderpath,
+                   verification_report=None, preview_writer=None):
+    """Parses, merges and saves the gripper and polaris recordings of a grasp
+
+    :param r: a record of grasp files, see _group_files_by_grasp_id
+    :param verification_report: if given, the grasp is also merged by the legacy path and compared, see
+                                grasp_dataset/verification.py
+    :param preview_writer: if given, previews of merged gripper data and images are added to it
+    :return: (the index record of the grasp, the merged gripper data), or None if the grasp is not selected
+    """
+    gripper_fp = path.join(args.input_folderpath, r['gripper_filepath'])
+    polaris_fp = path.join(args.input_folderpath, r['polaris_filepath'])
+    session_id = _extract_session_id_from_gripper_filepath(gripper_fp)
+
+    # a missing time difference can be recovered by clock offset refinement
+    parsed_gripper_file = parse_gripper_file(gripper_fp, require_time_difference=not args.refine_clock_offset)
+    # use the first timestamp in gripper recording as the date of a grasp session
+    session_date = pd.Timestamp(parsed_gripper_file.timestamps[0].date())
+
+    # grip type, status and date are only known after parsing the gripper file
+    if not selection.matches(grip_type=parsed_gripper_file.grip_type,
+                             is_success=parsed_gripper_file.is_grip_success,
+                             session_date=session_date):
+        return None
+
+    parsed_polaris_file = parse_polaris_file(polaris_fp)
+
+    # drop invalid polaris frames before they reach the coordinate transformation
+    parsed_polaris_file, polaris_quality_stats = \
+        gate_polaris_frames(parsed_polaris_file,
+                            max_quaternion_norm_error=args.max_quaternion_norm_error,
+                            max_speed=args.max_polaris_speed)
+
+    clock_offset_stats = {}
+    if args.refine_clock_offset:
+        parsed_gripper_file, clock_offset_stats = _refine_clock_offset(parsed_gripper_file, parsed_polaris_file,
+                                                                       polaris_coord_transformer, args)
+
+    # update daily origin
     if args.update_origin:
-        daily_origins = parse_daily_origin(args.daily_origin_filepath)
-
+        polaris_coord_transformer.object_origin = daily_origins\
+            .lookup_origin_by_session_date_and_id(session_date, session_id)
+
+    if verification_report is not None:
+        _verify_against_legacy(r['grasp_id'], parsed_gripper_file, parsed_polaris_file, polaris_coord_transformer,
+                               verification_report)
+
+    if args.merge_mode == 'gripper':
+        merged_ts, gripper_motor_records, tool1_params, tool2_params = \
+            _align_polaris_to_gripper(parsed_gripper_file.timestamps,
+                                      parsed_gripper_file.motor_records,
+                                      parsed_polaris_file.timestamps,
+                                      parsed_polaris_file.tool1_params,
+                                      parsed_polaris_file.tool2_params)
+
+        # transform polaris coordinates
+        polaris_records = polaris_coord_transformer.transform_batch(tool1_params, tool2_params,
+                                                                    orientation=args.orientation)
+
+        polaris_gripper_merged_df = _make_merged_df(merged_ts, gripper_motor_records, polaris_records,
+                                                    orientation=args.orientation)
+
+    else:
+        # transform polaris coordinates
+        polaris_records = polaris_coord_transformer.transform_batch(parsed_polaris_file.tool1_params,
+                                                                    parsed_polaris_file.tool2_params,
+                                                                    orientation=args.orientation)
+
+        gripper_motor_interps = _gripper_motor_records_to_interps(parsed_gripper_file.timestamps,
+                                                                  parsed_gripper_file.motor_records)
+
+        polaris_gripper_merged_df = _merge_polaris_gripper(parsed_polaris_file.timestamps,
+                                                           polaris_records,
+                                                           gripper_motor_interps,
+                                                           orientation=args.orientation)
+
+    gripper_data_filepath = _save_gripper_data(grasp_id=r['grasp_id'],
+                                               gripper_df=polaris_gripper_merged_df,
+                                               output_folderpath=output_folderpath)
+
+    if preview_writer is not None:
+        images = {name: np.load(path.join(args.input_folderpath, r[column])) for name, column in IMAGES.items()}
+        preview_writer.add(r['grasp_id'], polaris_gripper_merged_df, images)
+
+    processed_grasp = {
+        'id': r['grasp_id'],
+        'gripper_data_filepath': path.relpath(gripper_data_filepath, output_folderpath),
+        'rs_depth_image_filepath': r['rs_depth_image_filepath'],
+        'rs_color_image_filepath': r['rs_color_image_filepath'],
+        'zed_depth_image_filepath': r['zed_depth_image_filepath'],
+        'zed_color_image_filepath': r['zed_color_image_filepath'],
+        'grip_type': parsed_gripper_file.grip_type,
+        'is_success': parsed_gripper_file.is_grip_success,
+        'session_date': session_date,
+        'session_id': session_id,
+        'description': parsed_gripper_file.desc
+    }
+    processed_grasp.update(polaris_quality_stats)
+    processed_grasp.update(clock_offset_stats)
+
+    return processed_grasp, polaris_gripper_merged_df
+
+
+# save the index to disk, both as csv and as a typed binary index for fast selection, and dataset statistics
+def _save_index(processed_grasps, dataset_stats, output_folderpath):
+    index_df = pd.DataFrame(processed_grasps)
+    dataset_stats.save(path.join(output_folderpath, STATS_FILENAME))
+
+    # write to temporary files and rename, so that readers never see a partially written index
+    index_filepath = path.join(output_folderpath, 'index.csv')
+    index_df.to_csv(index_filepath + '.tmp', index=None)
+    os.replace(index_filepath + '.tmp', index_filepath)
+
+    if len(index_df) > 0:
+        binary_index_filepath = path.join(output_folderpath, BINARY_INDEX_FILENAME)
+        GraspIndex.from_dataframe(index_df).save(binary_index_filepath + '.tmp')
+        os.replace(binary_index_filepath + '.tmp', binary_index_filepath)
+
+    return index_df
+
+
+def _index_all(args, selection, polaris_coord_transformer, daily_origins, output_folderpath,
+               verification_report=None):
+    """Processes all grasps in the input folder into a new output folder
+    """
     print('list all grasp data files...')
     filepaths_df = _group_files_by_grasp_id(args.input_folderpath)
+
+    if args.shard is not None:
+        filepaths_df = filepaths_df[shard_mask(filepaths_df['grasp_id'], args.shard)]
+
     print(filepaths_df.head())
 
     # make output folder, remove if it already exists
-    if path.exists(args.output_folderpath):
-        logging.warning('removing output folder %s', args.output_folderpath)
-        rmtree(args.output_folderpath)
-    os.makedirs(args.output_folderpath)
+    if path.exists(output_folderpath):
+        logging.warning('removing output folder %s', output_folderpath)
+        rmtree(output_folderpath)
+    os.makedirs(output_folderpath)
 
     print('start processing gripper data...')
     processing_counts = 0
+    attempted_grasp_ids = []
     processed_grasps = []
+    dataset_stats = DatasetStats()
+    verification_rng = np.random.RandomState(args.verify_seed)
+    preview_writer = PreviewWriter(output_folderpath) if args.previews else None
 
     for r in tqdm(filepaths_df.to_dict('records')):
 
@@ -167,39 +390,20 @@ if __name__ == '__main__':
         if not args.limit_processing is None and processing_counts > args.limit_processing:
             break
 
-        gripper_fp = path.join(args.input_folderpath, r['gripper_filepath'])
-        polaris_fp = path.join(args.input_folderpath, r['polaris_filepath'])
+        session_id = _extract_session_id_from_gripper_filepath(path.join(args.input_folderpath,
+                                                                         r['gripper_filepath']))
+        if not selection.matches(id=r['grasp_id'], session_id=session_id):
+            continue
 
         processing_counts += 1
+        attempted_grasp_ids.append(r['grasp_id'])
 
-        try:
-            parsed_gripper_file = parse_gripper_file(gripper_fp)
-            parsed_polaris_file = parse_polaris_file(polaris_fp)
-
-            # update daily origin
-            if args.update_origin:
-                # use the first timestamp in polaris recording as the date of a grasp session
-                session_date = pd.Timestamp(parsed_gripper_file.timestamps[0].date())
-                session_id = _extract_session_id_from_gripper_filepath(gripper_fp)
-                polaris_coord_transformer.object_origin = daily_origins\
-                    .lookup_origin_by_session_date_and_id(session_date, session_id)
-
-            # transform polaris coordinates
-            polaris_records = [polaris_coord_transformer.transform_single_example(t1, t2)
-                               for t1, t2 in zip(parsed_polaris_file.tool1_params, parsed_polaris_file.tool2_params)]
-            polaris_records = np.array(polaris_records)
-
-            gripper_motor_interps = _gripper_motor_records_to_interps(parsed_gripper_file.timestamps,
-                                                                      parsed_gripper_file.motor_records)
-
-            polaris_gripper_merged_df = _merge_polaris_gripper(parsed_polaris_file.timestamps,
-                                                               polaris_records,
-                                                               gripper_motor_interps)
-
-            gripper_data_filepath = _save_gripper_data(grasp_id=r['grasp_id'],
-                                                       gripper_df=polaris_gripper_merged_df,
-                                                       output_folderpath=args.output_folderpath)
+        verify = verification_report is not None and verification_rng.rand() < args.verify_against_legacy
 
+        try:
+            processed = _process_grasp(r, args, selection, polaris_coord_transformer, daily_origins,
+                                       output_folderpath, verification_report if verify else None,
+                                       preview_writer=preview_writer)
         except ValueError as e:
             logging.warning('%s processing record %s, probably something wrong in coordinate transformation', e, r)
             continue
@@ -207,23 +411,230 @@ if __name__ == '__main__':
             logging.warning('unhandled exception %s processing record %s', e, r)
             continue
 
-        # writes into index only if file processing is successful
-        processed_grasp = {
-            'id': r['grasp_id'],
-            'gripper_data_filepath': path.relpath(gripper_data_filepath, args.output_folderpath),
-            'rs_depth_image_filepath': r['rs_depth_image_filepath'],
-            'rs_color_image_filepath': r['rs_color_image_filepath'],
-            'zed_depth_image_filepath': r['zed_depth_image_filepath'],
-            'zed_color_image_filepath': r['zed_color_image_filepath'],
-            'grip_type': parsed_gripper_file.grip_type,
-            'is_success': parsed_gripper_file.is_grip_success,
-            'description': parsed_gripper_file.desc
-        }
+        # grasp turned out not to be selected once its gripper file was parsed
+        if processed is None:
+            processing_counts -= 1
+            attempted_grasp_ids.pop()
+            continue
 
+        # writes into index only if file processing is successful
+        processed_grasp, gripper_df = processed
         processed_grasps.append(processed_grasp)
+        dataset_stats.update(processed_grasp, gripper_df)
+
+    index_df = _save_index(processed_grasps, dataset_stats, output_folderpath)
+    if preview_writer is not None:
+        preview_writer.save()
 
-    # save the index to disk
-    pd.DataFrame(processed_grasps).to_csv(path.join(args.output_folderpath, 'index.csv'), index=None)
+    if args.shard is not None:
+        write_shard_manifest(output_folderpath, args.shard, attempted_grasp_ids, len(index_df), args.select)
 
     print('processing finished, attempted processing {} grasps, successed in {} grasps'
           .format(processing_counts, len(processed_grasps)))
+
+    if verification_report is not None:
+        verification_report.save(path.join(output_folderpath, VERIFICATION_FILENAME))
+        print(verification_report.summary())
+
+
+def _watch(args, selection, polaris_coord_transformer, daily_origins, output_folderpath,
+           verification_report=None):
+    """Processes grasps as soon as all their files are written, appending them to the index in output_folderpath,
+    until interrupted by ctrl-c
+    """
+    if not path.exists(output_folderpath):
+        os.makedirs(output_folderpath)
+
+    processed_grasps = []
+    try:
+        index_df = pd.read_csv(path.join(output_folderpath, 'index.csv'))
+        # session dates are read back as strings, make them timestamps like those of newly processed grasps,
+        # so that the index is written with a single date format
+        if 'session_date' in index_df:
+            index_df['session_date'] = pd.to_datetime(index_df['session_date'], format='ISO8601')
+        processed_grasps = index_df.to_dict('records')
+    except (IOError, pd.errors.EmptyDataError):
+        pass
+
+    # statistics of earlier runs are extended with grasps processed while watching
+    dataset_stats = DatasetStats()
+    stats_filepath = path.join(output_folderpath, STATS_FILENAME)
+    if path.exists(stats_filepath):
+        dataset_stats = DatasetStats.load(stats_filepath)
+    elif len(processed_grasps) > 0:
+        logging.warning('%s not found, statistics cover only grasps processed from now on', stats_filepath)
+
+    indexed_grasp_ids = set(g['id'] for g in processed_grasps)
+    attempted_grasp_ids = list(indexed_grasp_ids)
+    is_unsaved = False
+    verification_rng = np.random.RandomState(args.verify_seed)
+    # previews of earlier runs are appended to
+    preview_writer = PreviewWriter(output_folderpath) if args.previews else None
+
+    watcher = GraspFileWatcher(args.input_folderpath, _FILETYPES, settle_seconds=args.watch_settle_seconds)
+    print('watching {} for new grasps, {} grasps already indexed, press ctrl-c to stop...'
+          .format(args.input_folderpath, len(indexed_grasp_ids)))
+
+    try:
+        while True:
+            new_grasps = []
+
+            for r in watcher.poll():
+                if r['grasp_id'] in indexed_grasp_ids:
+                    continue
+                if args.shard is not None and not in_shard(r['grasp_id'], args.shard):
+                    continue
+
+                session_id = _extract_session_id_from_gripper_filepath(path.join(args.input_folderpath,
+                                                                                 r['gripper_filepath']))
+                if not selection.matches(id=r['grasp_id'], session_id=session_id):
+                    continue
+
+                verify = verification_report is not None and verification_rng.rand() < args.verify_against_legacy
+
+                try:
+                    processed = _process_grasp(r, args, selection, polaris_coord_transformer, daily_origins,
+                                               output_folderpath, verification_report if verify else None,
+                                               preview_writer=preview_writer)
+                except Exception as e:
+                    logging.warning('exception %s processing record %s', e, r)
+                    attempted_grasp_ids.append(r['grasp_id'])
+                    print('grasp {} failed: {}'.format(r['grasp_id'], e))
+                    continue
+
+                if processed is None:
+                    continue
+
+                processed_grasp, gripper_df = processed
+                dataset_stats.update(processed_grasp, gripper_df)
+                attempted_grasp_ids.append(r['grasp_id'])
+                indexed_grasp_ids.add(r['grasp_id'])
+                new_grasps.append(processed_grasp)
+                print('grasp {} indexed, grip type {}, success {}, {} of {} polaris frames valid'
+                      .format(r['grasp_id'], processed_grasp['grip_type'], processed_grasp['is_success'],
+                              processed_grasp['polaris_valid_frames'], processed_grasp['polaris_frames']))
+
+            processed_grasps.extend(new_grasps)
+            is_unsaved = is_unsaved or len(new_grasps) > 0
+
+            # a failed write is retried at the next poll rather than ending the collection session
+            if is_unsaved:
+                try:
+                    _save_index(processed_grasps, dataset_stats, output_folderpath)
+                    if preview_writer is not None:
+                        preview_writer.save()
+                    is_unsaved = False
+                except Exception as e:
+                    logging.exception('failed saving index to %s', output_folderpath)
+                    print('failed saving index, retrying at the next poll: {}'.format(e))
+
+            time.sleep(args.watch_interval)
+
+    except KeyboardInterrupt:
+        print('stopped watching, {} grasps in index'.format(len(processed_grasps)))
+        if is_unsaved:
+            print('the latest grasps could not be saved, see {}'.format(args.log_filename))
+
+    if verification_report is not None:
+        verification_report.save(path.join(output_folderpath, VERIFICATION_FILENAME))
+        print(verification_report.summary())
+
+    # the shard is only complete if its index holds every processed grasp
+    if args.shard is not None and not is_unsaved:
+        write_shard_manifest(output_folderpath, args.shard, attempted_grasp_ids, len(processed_grasps), args.select)
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Index gripper data')
+    parser.add_argument('--input-folderpath', action='store', type=str, required=True)
+    parser.add_argument('--output-folderpath', action='store', type=str, required=True)
+    parser.add_argument('--update-origin', action='store_true', default=False)
+    parser.add_argument('--daily-origin-filepath', action='store', type=str,
+                        default='Data Collection - DailyOrigin.csv')
+    parser.add_argument('--transformation-constants-filepath', action='store', type=str,
+                        default='transformation.constants')
+    parser.add_argument('--log-filename', action='store', type=str, default='log.txt')
+    parser.add_argument('--limit-processing', action='store', type=int, default=None)
+    # predicates such as grip_type=5,12, is_success=true, session_date=2018-07-25:2018-07-31, session_id=1
+    # or id=352318:352400, repeat to select grasps satisfying all predicates
+    parser.add_argument('--select', action='append', type=str, default=None)
+    # process only the i-th of N shards of grasps, partitioned by grasp id hash,
+    # outputs are written into a shard subdirectory, see merge_shards.py
+    parser.add_argument('--shard', action='store', type=parse_shard, default=None)
+    # polaris frames whose quaternion norm deviates further from 1, or which move faster (mm/s), are dropped
+    parser.add_argument('--max-quaternion-norm-error', action='store', type=float, default=1e-2)
+    parser.add_argument('--max-polaris-speed', action='store', type=float, default=1000.0)
+    # representation of polaris orientations in gripper data, axis_angle: polaris_r[xyz],
+    # quaternion: polaris_q[rxyz], rotation_matrix: polaris_r[012][012] (row, column),
+    # rotation_6d: polaris_r6d_[0-5], the first two columns of the rotation matrix
+    parser.add_argument('--orientation', action='store', type=str,
+                        choices=sorted(polaris_coord_transform.ORIENTATION_REPRESENTATIONS), default='axis_angle')
+    # keep processing grasps as their files appear in the input folder, appending to an existing index
+    parser.add_argument('--watch', action='store_true', default=False)
+    # seconds between polls, and seconds since the last modification of any file of a grasp before it is processed
+    parser.add_argument('--watch-interval', action='store', type=float, default=0.2)
+    parser.add_argument('--watch-settle-seconds', action='store', type=float, default=0.5)
+    # polaris: interpolate gripper motor records at polaris timestamps
+    # gripper: interpolate polaris poses at gripper timestamps
+    parser.add_argument('--merge-mode', action='store', type=str, choices=['polaris', 'gripper'], default='polaris')
+    # refine the synchronization by the time difference in gripper files with the offset, within +-window seconds,
+    # which best correlates gripper motor 2 closure speed with polaris speed, applied if confident enough
+    parser.add_argument('--refine-clock-offset', action='store_true', default=False)
+    parser.add_argument('--clock-offset-window', action='store', type=float, default=0.5)
+    parser.add_argument('--clock-offset-min-confidence', action='store', type=float, default=0.5)
+    # write min/max decimated gripper data and block-averaged images of every grasp into previews.bin,
+    # see grasp_dataset/previews.py
+    parser.add_argument('--previews', action='store_true', default=False)
+    # fraction of grasps, sampled at random, also merged by the legacy per-frame path and compared with the fast
+    # path, deviations beyond tolerances (motor units, mm, radians) are reported in verification.json,
+    # only --merge-mode polaris with --orientation axis_angle has a legacy path and is verified
+    # the orientation tolerance allows for the static transformation of tool 339, built from 4 decimal quaternions
+    # of transformation.constants, being off orthonormal by about 3.5e-4: both paths read it differently, measured
+    # up to 1e-4 radians for rotations below 1.5 radians and 7e-4 below 2 radians, see README
+    parser.add_argument('--verify-against-legacy', action='store', type=float, default=None)
+    parser.add_argument('--verify-seed', action='store', type=int, default=0)
+    parser.add_argument('--verify-motor-tolerance', action='store', type=float, default=1e-6)
+    parser.add_argument('--verify-position-tolerance', action='store', type=float, default=1e-6)
+    parser.add_argument('--verify-orientation-tolerance', action='store', type=float, default=1e-3)
+
+    args = parser.parse_args()
+
+    selection = Selection.parse(args.select)
+
+    # setupt file logging
+    logging.basicConfig(filename=args.log_filename, filemode='w', level=logging.DEBUG)
+
+    # prepare polaris coordinate transformer
+    print('prepare polaris coords transformations...')
+    polaris_coord_transform_constants = polaris_coord_transform.ndi_transformation(args.transformation_constants_filepath)
+    polaris_coord_transformer = polaris_coord_transform.Transformer(polaris_coord_transform_constants)
+
+    # prepare daily origins for coordinate transformation
+    daily_origins = None
+    if args.update_origin:
+        daily_origins = parse_daily_origin(args.daily_origin_filepath)
+
+    # each shard owns a subdirectory of the output folder so that shards never remove each other's outputs
+    output_folderpath = args.output_folderpath
+    if args.shard is not None:
+        output_folderpath = path.join(args.output_folderpath, shard_dirname(args.shard))
+
+    verification_report = None
+    if args.verify_against_legacy is not None:
+        if not 0 < args.verify_against_legacy <= 1:
+            raise ValueError('--verify-against-legacy must be a fraction in (0, 1], got {}'
+                             .format(args.verify_against_legacy))
+        verification_report = VerificationReport({'gripper_motor': args.verify_motor_tolerance,
+                                                  'polaris_position': args.verify_position_tolerance,
+                                                  'polaris_orientation': args.verify_orientation_tolerance})
+        if (args.merge_mode, args.orientation) != (VERIFIED_MERGE_MODE, VERIFIED_ORIENTATION):
+            print('verifying --merge-mode {} with --orientation {} only, the indexed --merge-mode {} with '
+                  '--orientation {} has no legacy path'.format(VERIFIED_MERGE_MODE, VERIFIED_ORIENTATION,
+                                                              args.merge_mode, args.orientation))
+
+    if args.watch:
+        _watch(args, selection, polaris_coord_transformer, daily_origins, output_folderpath, verification_report)
+    else:
+        _index_all(args, selection, polaris_coord_transformer, daily_origins, output_folderpath,
+                   verification_report)
@@ -1,4 +1,7 @@
 import argparse
+import os
+from functools import partial
+from multiprocessing import Pool
 from os import path
 
 import pandas as pd
@@ -7,7 +10,35 @@ from tqdm import tqdm
 # append current directory to sys path
 import sys
 sys.path.insert(0, '.')
-from polaris_motor_data_extraction.data_extractors import PolarisMotorDataExtractor
+from grasp_dataset.index import GraspIndex, Selection, BINARY_INDEX_FILENAME
+from grasp_dataset.sequences import SequenceWriter, split_sequence
+from grasp_dataset.sharding import parse_shard, shard_mask, shard_dirname, write_shard_manifest
+from polaris_motor_data_extraction.data_extractors import PolarisMotorDataExtractor, MOTOR_COLUMNS, \
+    POLARIS_COLUMNS, polaris_columns_of
+
+
+# parses a comma separated list of ints, e.g. 5,11,21
+def _int_list(s):
+    return [int(v) for v in s.split(',')]
+
+
+# parses a comma separated list of column names
+def _str_list(s):
+    return [v.strip() for v in s.split(',')]
+
+
+# extract motor and polaris data of a grasp and merge it with its index record, runs in worker processes
+def _extract_record(polaris_motor_data_extractor, data_folderpath, r):
+    gripper_data_filepath = path.join(data_folderpath, r['gripper_data_filepath'])
+    parsed_record = polaris_motor_data_extractor(gripper_data_filepath)
+
+    # remove gripper_data_filepath from the record since it was extracted
+    parsed_record.pop('gripper_data_filepath', None)
+
+    # merge motor and polaris data with original record
+    parsed_record.update(r)
+
+    return parsed_record
 
 
 if __name__ == '__main__':
@@ -16,26 +47,99 @@ if __name__ == '__main__':
     parser.add_argument('--data-folderpath', action='store', type=str, required=True)
     parser.add_argument('--output-folderpath', action='store', type=str, required=True)
     parser.add_argument('--extractor', action='store', type=str, default='min_extractor')
+    # window_stats_extractor: comma separated odd window sizes and window center offsets from the closure point,
+    # in records, and columns to extract statistics from, defaults to 5,11,21, -10,0,10 and all motor and
+    # polaris columns
+    parser.add_argument('--window-sizes', action='store', type=_int_list, default=None)
+    parser.add_argument('--window-offsets', action='store', type=_int_list, default=None)
+    parser.add_argument('--window-columns', action='store', type=_str_list, default=None)
+    # selection predicates, see index_dataset.py
+    parser.add_argument('--select', action='append', type=str, default=None)
+    # process only the i-th of N shards of grasps, see index_dataset.py
+    parser.add_argument('--shard', action='store', type=parse_shard, default=None)
+    # features: one row of extracted features per grasp in grasp_data.csv
+    # sequences: fixed-length sequences of merged gripper data in binary shard files, see grasp_dataset/sequences.py
+    parser.add_argument('--export', action='store', type=str, choices=['features', 'sequences'], default='features')
+    # padded: one sequence per grasp, truncated or zero-padded to --sequence-length
+    # windows: windows of --sequence-length records every --window-stride records
+    parser.add_argument('--sequence-mode', action='store', type=str, choices=['padded', 'windows'], default='padded')
+    parser.add_argument('--sequence-length', action='store', type=int, default=256)
+    parser.add_argument('--window-stride', action='store', type=int, default=None)
+    parser.add_argument('--sequences-per-file', action='store', type=int, default=1024)
+    # number of processes extracting features, grasps are written in index order regardless
+    parser.add_argument('--workers', action='store', type=int, default=1)
 
     args = parser.parse_args()
 
-    # read index
-    index_df = pd.read_csv(path.join(args.data_folderpath, 'index.csv'))
+    selection = Selection.parse(args.select)
+
+    # read index, only the selected grasps are processed
+    if selection:
+        binary_index_filepath = path.join(args.data_folderpath, BINARY_INDEX_FILENAME)
+        if path.exists(binary_index_filepath):
+            grasp_index = GraspIndex.load(binary_index_filepath)
+        else:
+            grasp_index = GraspIndex.from_dataframe(pd.read_csv(path.join(args.data_folderpath, 'index.csv')))
+        index_df = grasp_index.to_dataframe(grasp_index.select(selection))
+    else:
+        index_df = pd.read_csv(path.join(args.data_folderpath, 'index.csv'))
+
+    output_folderpath = args.output_folderpath
+    if args.shard is not None:
+        index_df = index_df[shard_mask(index_df['id'], args.shard)]
+        output_folderpath = path.join(args.output_folderpath, shard_dirname(args.shard))
+        if not path.exists(output_folderpath):
+            os.makedirs(output_folderpath)
+
+    # orientation columns of polaris depend on index_dataset.py --orientation, which is the same for all grasps
+    polaris_columns = POLARIS_COLUMNS
+    if len(index_df) > 0:
+        polaris_columns = polaris_columns_of(path.join(args.data_folderpath, index_df['gripper_data_filepath'].iloc[0]))
+
+    if args.export == 'sequences':
+        # motor columns followed by polaris columns
+        sequence_columns = MOTOR_COLUMNS + polaris_columns
+        sequence_writer = SequenceWriter(output_folderpath, args.sequence_length, sequence_columns,
+                                         shard_size=args.sequences_per_file, mode=args.sequence_mode)
+
+        for r in tqdm(index_df.to_dict('records')):
+            gripper_data_filepath = path.join(args.data_folderpath, r['gripper_data_filepath'])
+            frames = pd.read_csv(gripper_data_filepath, usecols=sequence_columns)[sequence_columns].values
+
+            for sequence, length in split_sequence(frames, args.sequence_length,
+                                                   mode=args.sequence_mode, stride=args.window_stride):
+                sequence_writer.add(sequence, length, r['id'], r['grip_type'], r['is_success'])
+
+        sequence_writer.close()
+
+        print('exported {} sequences of {} grasps'.format(sequence_writer.num_sequences, len(index_df)))
+        num_records = len(index_df)
 
-    polaris_motor_data_extractor = PolarisMotorDataExtractor.factory(args.extractor)
+    else:
+        extractor_kwargs = {'polaris_columns': polaris_columns}
+        for option, kwarg in (('window_sizes', 'window_sizes'), ('window_offsets', 'offsets'),
+                              ('window_columns', 'columns')):
+            if getattr(args, option) is not None:
+                if args.extractor != 'window_stats_extractor':
+                    raise ValueError('--{} only applies to window_stats_extractor'.format(option.replace('_', '-')))
+                extractor_kwargs[kwarg] = getattr(args, option)
 
-    parsed_records = []
-    for r in tqdm(index_df.to_dict('records')):
-        # extract motor and polaris data
-        gripper_data_filepath = path.join(args.data_folderpath, r['gripper_data_filepath'])
-        parsed_record = polaris_motor_data_extractor(gripper_data_filepath)
+        polaris_motor_data_extractor = PolarisMotorDataExtractor.factory(args.extractor, **extractor_kwargs)
 
-        # remove gripper_data_filepath from the record since it was extracted
-        parsed_record.pop('gripper_data_filepath', None)
+        index_records = index_df.to_dict('records')
+        extract_record = partial(_extract_record, polaris_motor_data_extractor, args.data_folderpath)
 
-        # merge motor and polaris data with original record
-        parsed_record.update(r)
+        if args.workers > 1:
+            with Pool(args.workers) as pool:
+                # imap yields in input order, chunks amortize inter-process communication
+                chunksize = max(1, min(64, len(index_records) // (args.workers * 4)))
+                parsed_records = list(tqdm(pool.imap(extract_record, index_records, chunksize=chunksize),
+                                           total=len(index_records)))
+        else:
+            parsed_records = [extract_record(r) for r in tqdm(index_records)]
 
-        parsed_records.append(parsed_record)
+        pd.DataFrame(parsed_records).to_csv(path.join(output_folderpath, 'grasp_data.csv'), index=None)
+        num_records = len(parsed_records)
 
-    pd.DataFrame(parsed_records).to_csv(path.join(args.output_folderpath, 'grasp_data.csv'), index=None)
\ No newline at end of file
+    if args.shard is not None:
+        write_shard_manifest(output_folderpath, args.shard, index_df['id'], num_records, args.select)
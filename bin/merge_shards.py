@@ -0,0 +1,59 @@
+import argparse
+from glob import glob
+from os import path
+
+# append current directory to sys path
+import sys
+sys.path.insert(0, '.')
+
+from grasp_dataset.index import GraspIndex, BINARY_INDEX_FILENAME
+from grasp_dataset.previews import merge_previews, PREVIEWS_INDEX_FILENAME
+from grasp_dataset.sequences import merge_sequence_shards
+from grasp_dataset.sharding import completed_shards, merge_shard_fragments
+from grasp_dataset.stats import DatasetStats, STATS_FILENAME
+
+
+if __name__ == '__main__':
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Merge shards produced by index_dataset.py or make_training_data.py')
+    parser.add_argument('--output-folderpath', action='store', type=str, required=True)
+    # index: merge index.csv fragments of index_dataset.py, grasp_data: merge grasp_data.csv of make_training_data.py,
+    # sequences: merge sequence exports of make_training_data.py --export sequences
+    parser.add_argument('--fragment', action='store', type=str, choices=['index', 'grasp_data', 'sequences'],
+                        default='index')
+
+    args = parser.parse_args()
+
+    if args.fragment == 'index':
+        # gripper data files stay in shard subdirectories, their paths are made relative to the output folder
+        merged_df = merge_shard_fragments(args.output_folderpath, 'index.csv',
+                                          relocate_columns=['gripper_data_filepath'])
+        # preview files stay in shard subdirectories too, merged first so that
+        # shards with mismatching previews fail before the merged index is written
+        preview_dirnames = [path.basename(path.dirname(fp)) for fp in
+                            sorted(glob(path.join(args.output_folderpath, 'shard-*', PREVIEWS_INDEX_FILENAME)))]
+        if preview_dirnames:
+            merge_previews(args.output_folderpath, preview_dirnames)
+
+        merged_df.to_csv(path.join(args.output_folderpath, 'index.csv'), index=None)
+        GraspIndex.from_dataframe(merged_df).save(path.join(args.output_folderpath, BINARY_INDEX_FILENAME))
+
+        # shards hold disjoint grasps, so their statistics merge exactly
+        dataset_stats = DatasetStats()
+        for stats_filepath in sorted(glob(path.join(args.output_folderpath, 'shard-*', STATS_FILENAME))):
+            dataset_stats.merge(DatasetStats.load(stats_filepath))
+        dataset_stats.save(path.join(args.output_folderpath, STATS_FILENAME))
+
+        print('merged {} grasps'.format(len(merged_df)))
+    elif args.fragment == 'grasp_data':
+        merged_df = merge_shard_fragments(args.output_folderpath, 'grasp_data.csv')
+        merged_df.to_csv(path.join(args.output_folderpath, 'grasp_data.csv'), index=None)
+
+        print('merged {} grasps'.format(len(merged_df)))
+    else:
+        # sequence files stay in shard subdirectories, shards without any grasp have nothing to merge
+        shards = completed_shards(args.output_folderpath)
+        header = merge_sequence_shards(args.output_folderpath, [d for d, m in shards if m['num_records'] > 0])
+
+        print('merged {} sequences of {} grasps'.format(sum(s['num_sequences'] for s in header['shards']),
+                                                        sum(m['num_records'] for _, m in shards)))
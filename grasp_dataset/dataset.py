@@ -0,0 +1,253 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+
+import numpy as np
+import pandas as pd
+
+from grasp_dataset.index import GraspIndex, BINARY_INDEX_FILENAME
+
+# modality name => index column of its file
+MODALITIES = OrderedDict([
+    ('frames', 'gripper_data_filepath'),
+    ('rs_depth', 'rs_depth_image_filepath'),
+    ('rs_color', 'rs_color_image_filepath'),
+    ('zed_depth', 'zed_depth_image_filepath'),
+    ('zed_color', 'zed_color_image_filepath')
+])
+
+
+def _nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return value.nbytes
+
+
+class LRUCache(object):
+    """A thread-safe least recently used cache bounded by the total size of its values in bytes
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key => (value, size in bytes), least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        """
+        :return: the cached value, or None if key is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Caches a value, evicting least recently used values until it fits,
+        values larger than the cache itself are not cached
+        """
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            while self._entries and self.nbytes + size > self.max_bytes:
+                self.nbytes -= self._entries.popitem(last=False)[1][1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+class Grasp(object):
+    """A grasp of a GraspDataset, each modality is only loaded, or taken from the cache, when accessed
+    """
+
+    def __init__(self, dataset, record):
+        self._dataset = dataset
+        self.record = record
+
+    @property
+    def id(self):
+        return self.record['id']
+
+    @property
+    def frames(self):
+        """Merged gripper motor and polaris data, a DataFrame shared with the cache, copy before modifying it
+        """
+        return self._dataset.load(self.id, 'frames')
+
+    @property
+    def rs_depth(self):
+        return self._dataset.load(self.id, 'rs_depth')
+
+    @property
+    def rs_color(self):
+        return self._dataset.load(self.id, 'rs_color')
+
+    @property
+    def zed_depth(self):
+        return self._dataset.load(self.id, 'zed_depth')
+
+    @property
+    def zed_color(self):
+        return self._dataset.load(self.id, 'zed_color')
+
+    def __repr__(self):
+        return 'Grasp(id={}, grip_type={}, is_success={})'.format(self.id, self.record['grip_type'],
+                                                                  self.record['is_success'])
+
+
+class _GraspsById(object):
+    def __init__(self, dataset):
+        self._dataset = dataset
+
+    def __getitem__(self, grasp_id):
+        return self._dataset.grasp(grasp_id)
+
+
+class GraspDataset(object):
+    """Random access to the grasps of an index produced by index_dataset.py,
+    merged frames and images are read lazily per modality and kept in a byte-bounded LRU cache
+
+        dataset = GraspDataset('out', images_folderpath='data-sample')
+        dataset[0].rs_depth            # by position in the index
+        dataset.loc[352318].frames     # by grasp id
+    """
+
+    def __init__(self, folderpath, images_folderpath=None, selection=None, cache_bytes=1 << 30, prefetch_workers=4):
+        """
+        :param folderpath: output folder of index_dataset.py, containing index.csv and gripper_data
+        :param images_folderpath: input folder of index_dataset.py, which image paths are relative to,
+                                  defaults to folderpath
+        :param selection: a Selection of grasps, all grasps if None
+        :param cache_bytes: max total size of cached frames and images
+        :param prefetch_workers: number of threads loading grasps in prefetch
+        """
+        self.folderpath = folderpath
+        self.images_folderpath = images_folderpath if images_folderpath is not None else folderpath
+        self.cache = LRUCache(cache_bytes)
+        self.prefetch_workers = prefetch_workers
+        self._executor = None
+
+        if selection:
+            binary_index_filepath = path.join(folderpath, BINARY_INDEX_FILENAME)
+            if path.exists(binary_index_filepath):
+                grasp_index = GraspIndex.load(binary_index_filepath)
+            else:
+                grasp_index = GraspIndex.from_dataframe(pd.read_csv(path.join(folderpath, 'index.csv')))
+            self.index_df = grasp_index.to_dataframe(grasp_index.select(selection))
+        else:
+            self.index_df = pd.read_csv(path.join(folderpath, 'index.csv'))
+
+        self.index_df = self.index_df.reset_index(drop=True)
+        self._records = self.index_df.to_dict('records')
+        self._positions = {r['id']: i for i, r in enumerate(self._records)}
+
+        self.loc = _GraspsById(self)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, position):
+        """
+        :param position: position of the grasp in the index, negative positions count from the end
+        :return: a Grasp
+        """
+        if position < -len(self) or position >= len(self):
+            raise IndexError('position {} is out of range of {} grasps'.format(position, len(self)))
+        return Grasp(self, self._records[position])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def ids(self):
+        return [r['id'] for r in self._records]
+
+    def grasp(self, grasp_id):
+        """
+        :return: the Grasp of grasp_id
+        """
+        if grasp_id not in self._positions:
+            raise KeyError('grasp {} is not in the dataset'.format(grasp_id))
+        return Grasp(self, self._records[self._positions[grasp_id]])
+
+    def _filepath(self, record, modality):
+        if modality == 'frames':
+            return path.join(self.folderpath, record['gripper_data_filepath'])
+        return path.join(self.images_folderpath, record[MODALITIES[modality]])
+
+    def load(self, grasp_id, modality):
+        """Loads one modality of a grasp, from the cache if possible
+
+        :param grasp_id: the grasp id
+        :param modality: one of MODALITIES
+        :return: a DataFrame of merged frames, or a read-only image array
+        """
+        if modality not in MODALITIES:
+            raise ValueError('unknown modality {}, expected one of {}'.format(modality, list(MODALITIES)))
+
+        key = (grasp_id, modality)
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+
+        record = self.grasp(grasp_id).record
+        if modality == 'frames':
+            value = pd.read_csv(self._filepath(record, modality))
+        else:
+            value = np.load(self._filepath(record, modality))
+            # cached arrays are shared between callers
+            value.flags.writeable = False
+
+        self.cache.put(key, value)
+        return value
+
+    def prefetch(self, grasp_ids, modalities=None):
+        """Loads grasps into the cache in background threads,
+        prefetching more than fits into the cache evicts the grasps prefetched first
+
+        :param grasp_ids: ids of grasps to load
+        :param modalities: modalities to load, all if None
+        :return: a list of futures, one per grasp and modality
+        """
+        if modalities is None:
+            modalities = list(MODALITIES)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.prefetch_workers)
+
+        return [self._executor.submit(self.load, grasp_id, modality)
+                for grasp_id in grasp_ids for modality in modalities]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
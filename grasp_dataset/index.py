@@ -0,0 +1,260 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+BINARY_INDEX_FILENAME = 'index.npz'
+
+# columns which can be used in selection predicates, column name => value parser
+_SELECTABLE_COLUMNS = {
+    'id': int,
+    'grip_type': int,
+    'is_success': lambda v: _parse_bool(v),
+    'session_date': lambda v: np.datetime64(v, 'D'),
+    'session_id': int
+}
+
+# an encapsulation of a selection predicate, either a set of values or an inclusive [low, high] range
+Predicate = namedtuple('Predicate', 'column values low high')
+
+
+def _parse_bool(v):
+    if v.lower() in ('true', '1', 'yes'):
+        return True
+    if v.lower() in ('false', '0', 'no'):
+        return False
+    raise ValueError('{} is not a boolean'.format(v))
+
+
+def parse_predicate(expr):
+    """Parses a selection predicate of the form column=v1,v2,... or column=low:high
+
+    :param expr: predicate expression, e.g. grip_type=5,12 or session_date=2018-07-25:2018-07-31
+    :return: a Predicate
+    """
+    try:
+        column, value_expr = [t.strip() for t in expr.split('=', 1)]
+    except ValueError:
+        raise ValueError('predicate {} is not in the form column=value'.format(expr))
+
+    if column not in _SELECTABLE_COLUMNS:
+        raise ValueError('cannot select on column {}, selectable columns are {}'
+                         .format(column, sorted(_SELECTABLE_COLUMNS)))
+
+    parse_value = _SELECTABLE_COLUMNS[column]
+
+    if ':' in value_expr:
+        low, high = value_expr.split(':', 1)
+        # an empty bound means the range is open on that side
+        low = parse_value(low) if low else None
+        high = parse_value(high) if high else None
+        return Predicate(column, None, low, high)
+
+    return Predicate(column, [parse_value(v) for v in value_expr.split(',')], None, None)
+
+
+class Selection(object):
+    """A conjunction of predicates over grasp metadata
+    """
+
+    def __init__(self, predicates=()):
+        self.predicates = list(predicates)
+
+    @staticmethod
+    def parse(exprs):
+        """Builds a selection from a list of predicate expressions, see parse_predicate
+
+        :param exprs: a list of predicate expressions, None means select everything
+        :return: a Selection
+        """
+        return Selection([parse_predicate(e) for e in (exprs or [])])
+
+    def __bool__(self):
+        return len(self.predicates) > 0
+
+    def matches(self, **values):
+        """Tests a single grasp against predicates on the given columns,
+        predicates on columns not given are ignored so this can be evaluated incrementally
+        as metadata of a grasp becomes known
+
+        :param values: column name => value of a grasp
+        :return: True if the grasp satisfies all predicates on the given columns
+        """
+        for p in self.predicates:
+            if p.column not in values:
+                continue
+
+            v = values[p.column]
+            if p.column == 'session_date':
+                v = np.datetime64(v, 'D')
+
+            if p.values is not None:
+                if v not in p.values:
+                    return False
+            else:
+                if p.low is not None and v < p.low:
+                    return False
+                if p.high is not None and v > p.high:
+                    return False
+
+        return True
+
+
+class GraspIndex(object):
+    """A typed, column-oriented index of grasps sorted by grasp id,
+    grip type, status and session id selections, sets or ranges, are answered with precomputed bitmaps,
+    grasp id and session date ranges are answered with binary search over sorted columns
+    """
+
+    def __init__(self, columns):
+        """
+        :param columns: an ordered dict of column name => numpy array, sorted by id
+        """
+        self._columns = columns
+
+        # bitmaps for equality predicates on low cardinality columns
+        self._bitmaps = {}
+        for column in ('grip_type', 'is_success', 'session_id'):
+            values = columns[column]
+            self._bitmaps[column] = {v.item(): values == v for v in np.unique(values)}
+
+        # a permutation which sorts rows by session date, for date range lookups
+        self._session_date_order = np.argsort(columns['session_date'], kind='stable')
+        self._sorted_session_dates = columns['session_date'][self._session_date_order]
+
+    def __len__(self):
+        return len(self._columns['id'])
+
+    @property
+    def columns(self):
+        return list(self._columns.keys())
+
+    def __getitem__(self, column):
+        return self._columns[column]
+
+    @staticmethod
+    def from_dataframe(index_df):
+        """Builds an index from the dataframe saved as index.csv
+
+        :param index_df: the index dataframe, with at least id, grip_type and is_success columns
+        :return: a GraspIndex
+        """
+        index_df = index_df.sort_values(by=['id'])
+
+        columns = {}
+        for c in index_df.columns:
+            if c in ('id', 'grip_type'):
+                columns[c] = index_df[c].values.astype(np.int64)
+            elif c == 'is_success':
+                columns[c] = index_df[c].values.astype(bool)
+            elif c == 'session_date':
+                # indexes written by earlier watch runs may mix 2018-07-25 and 2018-07-25 00:00:00
+                columns[c] = pd.to_datetime(index_df[c], format='ISO8601').values.astype('datetime64[D]')
+            elif c == 'session_id':
+                columns[c] = index_df[c].values.astype(np.int8)
+            elif index_df[c].dtype.kind in 'biuf':
+                columns[c] = index_df[c].values
+            else:
+                # filepaths and descriptions, stored as fixed width unicode rather than pickled objects
+                columns[c] = np.array(index_df[c].fillna('').astype(str).tolist(), dtype=str)
+
+        # indexes produced before session columns were recorded
+        if 'session_date' not in columns:
+            columns['session_date'] = np.full(len(index_df), np.datetime64('NaT'), dtype='datetime64[D]')
+        if 'session_id' not in columns:
+            columns['session_id'] = np.full(len(index_df), -1, dtype=np.int8)
+
+        return GraspIndex(columns)
+
+    @staticmethod
+    def load(filepath):
+        """Loads an index saved by GraspIndex.save
+
+        :param filepath: path to the binary index
+        :return: a GraspIndex
+        """
+        with np.load(filepath, allow_pickle=False) as f:
+            column_names = [str(c) for c in f['__columns__']]
+            columns = {c: f[c] for c in column_names if c != 'grip_type'}
+            # grip type is stored as categorical codes into a small category table
+            columns['grip_type'] = f['__grip_type_categories__'][f['__grip_type_codes__']]
+
+        return GraspIndex({c: columns[c] for c in column_names})
+
+    def save(self, filepath):
+        """Saves the index in numpy's npz format, no pickled objects are stored
+
+        :param filepath: path to the binary index
+        """
+        grip_type_categories, grip_type_codes = np.unique(self._columns['grip_type'], return_inverse=True)
+
+        arrays = {c: v for c, v in self._columns.items() if c != 'grip_type'}
+        arrays['__columns__'] = np.array(self.columns)
+        arrays['__grip_type_categories__'] = grip_type_categories
+        arrays['__grip_type_codes__'] = grip_type_codes.astype(np.int16)
+
+        # np.savez appends .npz to file names without it
+        with open(filepath, 'wb') as f:
+            np.savez(f, **arrays)
+
+    def _predicate_mask(self, p):
+        mask = np.zeros(len(self), dtype=bool)
+
+        if p.column in self._bitmaps:
+            bitmaps = self._bitmaps[p.column]
+            if p.values is not None:
+                keys = [v for v in p.values if v in bitmaps]
+            else:
+                # a range is the union of the bitmaps of the few distinct values within it
+                keys = [v for v in bitmaps
+                        if (p.low is None or v >= p.low) and (p.high is None or v <= p.high)]
+            for v in keys:
+                mask |= bitmaps[v]
+            return mask
+
+        if p.column == 'session_date':
+            sorted_values, order = self._sorted_session_dates, self._session_date_order
+        else:
+            # ids are unique and the index is sorted by id
+            sorted_values, order = self._columns['id'], None
+
+        if p.values is not None:
+            ranges = [(v, v) for v in p.values]
+        else:
+            ranges = [(p.low, p.high)]
+
+        for low, high in ranges:
+            start = 0 if low is None else np.searchsorted(sorted_values, low, side='left')
+            end = len(self) if high is None else np.searchsorted(sorted_values, high, side='right')
+            if order is None:
+                mask[start:end] = True
+            else:
+                mask[order[start:end]] = True
+
+        return mask
+
+    def select(self, selection):
+        """Selects the rows satisfying all predicates in selection
+
+        :param selection: a Selection
+        :return: sorted row positions of selected grasps
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for p in selection.predicates:
+            mask &= self._predicate_mask(p)
+
+        return np.flatnonzero(mask)
+
+    def to_dataframe(self, rows=None):
+        """Converts (a subset of) the index back to a dataframe in index.csv layout
+
+        :param rows: row positions, e.g. from select, None means all rows
+        :return: a dataframe
+        """
+        if rows is None:
+            rows = slice(None)
+
+        df = pd.DataFrame({c: v[rows] for c, v in self._columns.items()})
+        df['session_date'] = pd.to_datetime(df['session_date'])
+
+        return df
@@ -0,0 +1,229 @@
+"""Multi-resolution previews of grasps for browsing and QA tools
+
+Previews of all grasps are appended to a single binary file, previews.bin, as raw little-endian C-ordered
+arrays, located by an offset index, previews.json, in the same folder. Each grasp has
+
+    frames_<f>          float32  [ceil(n / f), 2, C]   min (row 0) and max (row 1) of every C column of
+                                                       merged gripper data over blocks of f frames,
+                                                       column 0 is seconds since the first frame
+    <image>_<f>         depth: uint16 [h / f, w / f], color: uint8 [h / f, w / f, 3]
+                                                       block averages of f x f pixels, depth averages skip
+                                                       zero (invalid) pixels
+
+for every time series factor f and image factor f, images are rs_depth, rs_color, zed_depth and zed_color,
+pixels beyond the last whole block are cropped. A grasp's entry of the offset index is
+
+    {"filename": "previews.bin", "arrays": {name: [offset, dtype, shape], ...}}
+
+so reading a preview is one seek and one read of a few kilobytes.
+"""
+import json
+import os
+from os import path
+
+import numpy as np
+import pandas as pd
+
+PREVIEWS_FILENAME = 'previews.bin'
+PREVIEWS_INDEX_FILENAME = 'previews.json'
+FORMAT_VERSION = 1
+
+# image name => index column of its file
+IMAGES = {
+    'rs_depth': 'rs_depth_image_filepath',
+    'rs_color': 'rs_color_image_filepath',
+    'zed_depth': 'zed_depth_image_filepath',
+    'zed_color': 'zed_color_image_filepath'
+}
+
+
+def decimate_min_max(values, factor):
+    """
+    :param values: a nxC matrix
+    :param factor: number of rows per block, the last block may be shorter
+    :return: a ceil(n / factor)x2xC matrix of the min and max of each column over each block
+    """
+    n, c = values.shape
+    num_blocks = -(-n // factor)
+    padded = np.full((num_blocks * factor, c), np.nan)
+    padded[:n] = values
+    blocks = padded.reshape(num_blocks, factor, c)
+
+    return np.stack([np.nanmin(blocks, axis=1), np.nanmax(blocks, axis=1)], axis=1)
+
+
+def block_average(image, factor, skip_zeros=False):
+    """
+    :param image: a hxw or hxwxk array
+    :param factor: block size in pixels
+    :param skip_zeros: average only non-zero pixels, blocks without any are 0
+    :return: an array of shape (h // factor, w // factor) + image.shape[2:] of the dtype of image
+    """
+    h, w = image.shape[0] // factor, image.shape[1] // factor
+    blocks = image[:h * factor, :w * factor].astype(np.float64)
+    blocks = blocks.reshape((h, factor, w, factor) + image.shape[2:])
+
+    if skip_zeros:
+        sums = blocks.sum(axis=(1, 3))
+        counts = np.count_nonzero(blocks, axis=(1, 3))
+        averaged = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+    else:
+        averaged = blocks.mean(axis=(1, 3))
+
+    if np.issubdtype(image.dtype, np.integer):
+        averaged = np.round(averaged)
+    return averaged.astype(image.dtype)
+
+
+class PreviewWriter(object):
+    """Appends previews of grasps to previews.bin in output_folderpath, the offset index is written by save
+    """
+
+    def __init__(self, output_folderpath, time_series_factors=(4, 16, 64), image_factors=(8, 32)):
+        """
+        :param output_folderpath: folder of previews.bin and previews.json, existing previews are appended to
+        :param time_series_factors: frames per block of each time series level
+        :param image_factors: pixels per block side of each image level
+        """
+        self.output_folderpath = output_folderpath
+        self.time_series_factors = list(time_series_factors)
+        self.image_factors = list(image_factors)
+        self.columns = None
+        self.grasps = {}
+
+        index_filepath = path.join(output_folderpath, PREVIEWS_INDEX_FILENAME)
+        if path.exists(index_filepath):
+            with open(index_filepath) as f:
+                index = json.load(f)
+            self.columns = index['columns']
+            self.grasps = index['grasps']
+
+    def _append(self, arrays):
+        entries = {}
+        with open(path.join(self.output_folderpath, PREVIEWS_FILENAME), 'ab') as f:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+                entries[name] = [f.tell(), array.dtype.str, list(array.shape)]
+                f.write(array.tobytes())
+        return entries
+
+    def add(self, grasp_id, merged_df, images):
+        """
+        :param grasp_id: the grasp id
+        :param merged_df: merged gripper data with a timestamp column
+        :param images: a dict of image name => image array, see IMAGES
+        """
+        columns = ['seconds'] + [c for c in merged_df.columns if c != 'timestamp']
+        if self.columns is None:
+            self.columns = columns
+        elif columns != self.columns:
+            raise ValueError('gripper data columns {} differ from columns {} of previous grasps'
+                             .format(columns, self.columns))
+
+        ts = pd.to_datetime(merged_df['timestamp'])
+        values = np.column_stack([(ts - ts.iloc[0]).dt.total_seconds().values,
+                                  merged_df[self.columns[1:]].values])
+
+        arrays = {}
+        for factor in self.time_series_factors:
+            arrays['frames_{}'.format(factor)] = decimate_min_max(values, factor).astype(np.float32)
+        for name, image in sorted(images.items()):
+            for factor in self.image_factors:
+                arrays['{}_{}'.format(name, factor)] = block_average(image, factor, skip_zeros=name.endswith('depth'))
+
+        # the offset index is only written by save, bytes appended by an interrupted run are never referenced
+        self.grasps[str(grasp_id)] = {'filename': PREVIEWS_FILENAME, 'arrays': self._append(arrays)}
+
+    def save(self):
+        index = {
+            'format_version': FORMAT_VERSION,
+            'columns': self.columns,
+            'time_series_factors': self.time_series_factors,
+            'image_factors': self.image_factors,
+            'grasps': self.grasps
+        }
+
+        index_filepath = path.join(self.output_folderpath, PREVIEWS_INDEX_FILENAME)
+        with open(index_filepath + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(index_filepath + '.tmp', index_filepath)
+
+
+class PreviewReader(object):
+    """Reads previews located by previews.json in folderpath
+    """
+
+    def __init__(self, folderpath):
+        self.folderpath = folderpath
+        with open(path.join(folderpath, PREVIEWS_INDEX_FILENAME)) as f:
+            index = json.load(f)
+
+        if index['format_version'] != FORMAT_VERSION:
+            raise ValueError('unsupported previews format version {}'.format(index['format_version']))
+
+        self.columns = index['columns']
+        self.time_series_factors = index['time_series_factors']
+        self.image_factors = index['image_factors']
+        self._grasps = {int(k): v for k, v in index['grasps'].items()}
+
+    @property
+    def ids(self):
+        return sorted(self._grasps)
+
+    def names(self, grasp_id):
+        """
+        :return: names of the preview arrays of a grasp, e.g. frames_16 or rs_depth_32
+        """
+        return sorted(self._grasps[grasp_id]['arrays'])
+
+    def read(self, grasp_id, name):
+        """
+        :return: the preview array name of a grasp
+        """
+        if grasp_id not in self._grasps:
+            raise KeyError('grasp {} has no previews'.format(grasp_id))
+        entry = self._grasps[grasp_id]
+        if name not in entry['arrays']:
+            raise KeyError('grasp {} has no preview {}, expected one of {}'.format(grasp_id, name,
+                                                                                  self.names(grasp_id)))
+
+        offset, dtype, shape = entry['arrays'][name]
+        with open(path.join(self.folderpath, entry['filename']), 'rb') as f:
+            f.seek(offset)
+            return np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def merge_previews(folderpath, shard_dirnames):
+    """Writes an offset index in folderpath of the previews of all shards, the preview files stay in the shard
+    subdirectories
+
+    :param folderpath: the output folder of shards
+    :param shard_dirnames: subdirectories of folderpath with previews, shards without grasps are skipped
+    """
+    merged = None
+    empty = None
+    for dirname in shard_dirnames:
+        with open(path.join(folderpath, dirname, PREVIEWS_INDEX_FILENAME)) as f:
+            index = json.load(f)
+
+        # shards whose grasps were all deselected or failed saved previews without columns
+        if not index['grasps']:
+            empty = dict(index, grasps={})
+            continue
+
+        if merged is None:
+            merged = dict(index, grasps={})
+        elif any(index[k] != merged[k] for k in ('columns', 'time_series_factors', 'image_factors')):
+            raise ValueError('previews of {} differ in columns or factors from previews of other shards'
+                             .format(dirname))
+
+        for grasp_id, entry in index['grasps'].items():
+            merged['grasps'][grasp_id] = dict(entry, filename=path.join(dirname, entry['filename']))
+
+    if merged is None:
+        merged = empty
+
+    index_filepath = path.join(folderpath, PREVIEWS_INDEX_FILENAME)
+    with open(index_filepath + '.tmp', 'w') as f:
+        json.dump(merged, f)
+    os.replace(index_filepath + '.tmp', index_filepath)
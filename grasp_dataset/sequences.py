@@ -0,0 +1,270 @@
+"""Fixed-length sequence export of merged gripper data, and a loader for training
+
+Sequences are written into shard files, sequences-00000.bin, sequences-00001.bin, ..., described by a
+header, sequences.json, in the same folder. A shard file of S sequences of length L with F columns is
+the concatenation of the following little-endian, C-ordered arrays without any padding in between,
+
+    offset                  dtype    shape       content
+    0                       int64    [S]         grasp ids
+    8S                      float32  [S, L, F]   frames, zero-padded after the sequence length
+    8S + 4SLF               int32    [S]         sequence lengths, number of valid frames
+    12S + 4SLF              int32    [S]         grip types
+    16S + 4SLF              uint8    [S]         is_success, 1 for success, 0 otherwise
+
+the total size of a shard file is 17S + 4SLF bytes.
+"""
+import json
+import threading
+from os import path
+from queue import Queue, Empty, Full
+
+import numpy as np
+
+SEQUENCES_HEADER_FILENAME = 'sequences.json'
+FORMAT_VERSION = 1
+
+
+def _shard_layout(num_sequences, sequence_length, num_columns):
+    """
+    :return: a list of (name, dtype, shape, offset) of arrays in a shard file
+    """
+    s = num_sequences
+    arrays = [('grasp_id', '<i8', (s,)),
+              ('frames', '<f4', (s, sequence_length, num_columns)),
+              ('length', '<i4', (s,)),
+              ('grip_type', '<i4', (s,)),
+              ('is_success', 'u1', (s,))]
+
+    layout = []
+    offset = 0
+    for name, dtype, shape in arrays:
+        layout.append((name, dtype, shape, offset))
+        offset += np.dtype(dtype).itemsize * int(np.prod(shape))
+
+    return layout
+
+
+def split_sequence(frames, sequence_length, mode='padded', stride=None):
+    """Splits the frames of one grasp into fixed-length sequences
+
+    :param frames: a nxF matrix of merged gripper data
+    :param sequence_length: length of produced sequences
+    :param mode: padded: a single sequence of the first sequence_length frames,
+                 windows: windows of sequence_length frames every stride frames
+    :param stride: distance between the starts of windows, defaults to sequence_length
+    :return: a list of (kxF matrix, k) where k <= sequence_length is the number of valid frames
+    """
+    n = len(frames)
+
+    if mode == 'padded' or n <= sequence_length:
+        return [(frames[:sequence_length], min(n, sequence_length))]
+
+    if mode != 'windows':
+        raise ValueError('unknown sequence mode {}'.format(mode))
+
+    stride = stride or sequence_length
+    starts = range(0, n - sequence_length + 1, stride)
+    return [(frames[s:s + sequence_length], sequence_length) for s in starts]
+
+
+class SequenceWriter(object):
+    """Buffers fixed-length sequences and writes them into shard files of shard_size sequences each
+    """
+
+    def __init__(self, output_folderpath, sequence_length, columns, shard_size=1024, mode='padded'):
+        self.output_folderpath = output_folderpath
+        self.sequence_length = sequence_length
+        self.columns = list(columns)
+        self.shard_size = shard_size
+        self.mode = mode
+
+        self._shards = []
+        self._buffer = []
+
+    def add(self, frames, length, grasp_id, grip_type, is_success):
+        """
+        :param frames: a kxF matrix, k <= sequence_length
+        :param length: number of valid frames
+        """
+        self._buffer.append((frames, length, grasp_id, grip_type, is_success))
+
+        if len(self._buffer) >= self.shard_size:
+            self._flush()
+
+    def _flush(self):
+        if len(self._buffer) == 0:
+            return
+
+        s = len(self._buffer)
+        arrays = {
+            'grasp_id': np.array([b[2] for b in self._buffer], dtype='<i8'),
+            'frames': np.zeros((s, self.sequence_length, len(self.columns)), dtype='<f4'),
+            'length': np.array([b[1] for b in self._buffer], dtype='<i4'),
+            'grip_type': np.array([b[3] for b in self._buffer], dtype='<i4'),
+            'is_success': np.array([b[4] for b in self._buffer], dtype='u1')
+        }
+        for i, b in enumerate(self._buffer):
+            arrays['frames'][i, :len(b[0])] = b[0]
+
+        filename = 'sequences-{:05d}.bin'.format(len(self._shards))
+        with open(path.join(self.output_folderpath, filename), 'wb') as f:
+            for name, dtype, shape, offset in _shard_layout(s, self.sequence_length, len(self.columns)):
+                assert f.tell() == offset
+                f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+
+        self._shards.append({'filename': filename, 'num_sequences': s})
+        self._buffer = []
+
+    def close(self):
+        """Writes remaining sequences and the header, the export is readable only after close
+        """
+        self._flush()
+
+        header = {
+            'format_version': FORMAT_VERSION,
+            'sequence_length': self.sequence_length,
+            'columns': self.columns,
+            'mode': self.mode,
+            'shards': self._shards
+        }
+        with open(path.join(self.output_folderpath, SEQUENCES_HEADER_FILENAME), 'w') as f:
+            json.dump(header, f, indent=2)
+
+    @property
+    def num_sequences(self):
+        return sum(s['num_sequences'] for s in self._shards) + len(self._buffer)
+
+
+class SequenceLoader(object):
+    """Iterates batches of sequences from memory-mapped shard files, batches are read
+    by a background thread and queued ahead of the consumer
+
+    each batch is a dict of grasp_id, frames, length, grip_type and is_success arrays, batches are drawn
+    from the sequences of all shard files, in file order or, with shuffle, in a random order across files
+    """
+
+    def __init__(self, folderpath, batch_size=32, shuffle=False, seed=None, prefetch=4):
+        with open(path.join(folderpath, SEQUENCES_HEADER_FILENAME)) as f:
+            self.header = json.load(f)
+
+        if self.header['format_version'] != FORMAT_VERSION:
+            raise ValueError('unsupported sequence format version {}'.format(self.header['format_version']))
+
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.prefetch = prefetch
+        self._rng = np.random.RandomState(seed)
+
+        self._shards = []
+        for shard in self.header['shards']:
+            filepath = path.join(folderpath, shard['filename'])
+            layout = _shard_layout(shard['num_sequences'], self.header['sequence_length'],
+                                   len(self.header['columns']))
+            self._shards.append({name: np.memmap(filepath, dtype=dtype, mode='r', offset=offset, shape=shape)
+                                 for name, dtype, shape, offset in layout})
+
+        # shard of each sequence, and its position within the shard
+        self._shard_inds = np.concatenate([np.full(len(s['grasp_id']), si) for si, s in enumerate(self._shards)]
+                                          + [np.zeros(0, dtype=int)]).astype(int)
+        self._sequence_inds = np.concatenate([np.arange(len(s['grasp_id'])) for s in self._shards]
+                                             + [np.zeros(0, dtype=int)]).astype(int)
+
+    @property
+    def columns(self):
+        return self.header['columns']
+
+    def __len__(self):
+        return int(np.ceil(len(self._shard_inds) / float(self.batch_size)))
+
+    def _batches(self):
+        order = np.arange(len(self._shard_inds))
+        if self.shuffle:
+            self._rng.shuffle(order)
+
+        for start in range(0, len(order), self.batch_size):
+            batch_order = order[start:start + self.batch_size]
+            shard_inds = self._shard_inds[batch_order]
+
+            # read each shard's part of the batch with sorted indices, which read the memory map front to back
+            parts = []
+            for si in np.unique(shard_inds):
+                indices = np.sort(self._sequence_inds[batch_order[shard_inds == si]])
+                # fancy indexing copies the batch out of the memory map
+                parts.append({name: array[indices] for name, array in self._shards[si].items()})
+
+            yield {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+
+    @staticmethod
+    def _put(queue, item, stop):
+        # waits for room in the queue, unless the consumer stopped iterating
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce(self, queue, stop):
+        try:
+            for batch in self._batches():
+                if not self._put(queue, batch, stop):
+                    return
+        except Exception as e:
+            self._put(queue, e, stop)
+            return
+
+        self._put(queue, None, stop)
+
+    def __iter__(self):
+        queue = Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(queue, stop))
+        producer.daemon = True
+        producer.start()
+
+        try:
+            while True:
+                batch = queue.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            # the consumer may stop early, e.g. after a fixed number of steps, release the producer
+            stop.set()
+            while True:
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    break
+            producer.join()
+
+
+def merge_sequence_shards(folderpath, shard_dirnames):
+    """Writes a header in folderpath describing the shard files of all sequence shards,
+    the shard files stay in the shard subdirectories
+
+    :param folderpath: the output folder of shards
+    :param shard_dirnames: subdirectories of folderpath with sequence exports
+    :return: the merged header
+    """
+    merged = None
+    for dirname in shard_dirnames:
+        with open(path.join(folderpath, dirname, SEQUENCES_HEADER_FILENAME)) as f:
+            header = json.load(f)
+
+        if merged is None:
+            merged = dict(header, shards=[])
+        elif any(header[k] != merged[k] for k in ('format_version', 'sequence_length', 'columns', 'mode')):
+            raise ValueError('sequences of {} differ in format, length, columns or mode from other shards'
+                             .format(dirname))
+
+        merged['shards'].extend(dict(shard, filename=path.join(dirname, shard['filename']))
+                                for shard in header['shards'])
+
+    with open(path.join(folderpath, SEQUENCES_HEADER_FILENAME), 'w') as f:
+        json.dump(merged, f, indent=2)
+
+    return merged
@@ -0,0 +1,166 @@
+import json
+import zlib
+from collections import namedtuple
+from glob import glob
+from os import path
+
+import numpy as np
+import pandas as pd
+
+SHARD_MANIFEST_FILENAME = 'shard_manifest.json'
+
+# an encapsulation of a shard spec, the shard_index-th of num_shards shards
+Shard = namedtuple('Shard', 'shard_index num_shards')
+
+
+def parse_shard(expr):
+    """Parses a shard spec of the form i/N, where 0 <= i < N
+
+    :param expr: shard spec, e.g. 0/4
+    :return: a Shard
+    """
+    try:
+        shard_index, num_shards = [int(t) for t in expr.split('/')]
+    except ValueError:
+        raise ValueError('shard {} is not in the form i/N'.format(expr))
+
+    if not 0 <= shard_index < num_shards:
+        raise ValueError('shard index must be in [0, {}), got {}'.format(num_shards, shard_index))
+
+    return Shard(shard_index, num_shards)
+
+
+def shard_of(grasp_id, num_shards):
+    """Assigns a grasp to a shard by hashing its id, the assignment is stable across machines and runs
+
+    :param grasp_id: an integer grasp id
+    :param num_shards: total number of shards
+    :return: the shard index of the grasp
+    """
+    return zlib.crc32(str(int(grasp_id)).encode('ascii')) % num_shards
+
+
+def in_shard(grasp_id, shard):
+    """
+    :param grasp_id: an integer grasp id
+    :param shard: a Shard
+    :return: True if the grasp belongs to shard
+    """
+    return shard_of(grasp_id, shard.num_shards) == shard.shard_index
+
+
+def shard_mask(grasp_ids, shard):
+    """
+    :param grasp_ids: an iterable of grasp ids
+    :param shard: a Shard
+    :return: a boolean array, True for grasps belonging to shard
+    """
+    return np.array([in_shard(g, shard) for g in grasp_ids], dtype=bool)
+
+
+def shard_dirname(shard):
+    return 'shard-{:03d}-of-{:03d}'.format(shard.shard_index, shard.num_shards)
+
+
+def write_shard_manifest(shard_folderpath, shard, attempted_grasp_ids, num_records, select=None):
+    """Marks a shard as complete, the manifest must be written after all fragments of the shard are saved
+
+    :param shard_folderpath: the output subdirectory of the shard
+    :param shard: a Shard
+    :param attempted_grasp_ids: ids of all grasps the shard attempted to process
+    :param num_records: number of records written into the shard's fragment
+    :param select: selection predicates the shard ran with, all shards must agree on them
+    """
+    manifest = {
+        'shard_index': shard.shard_index,
+        'num_shards': shard.num_shards,
+        'attempted_grasp_ids': [int(g) for g in attempted_grasp_ids],
+        'num_records': int(num_records),
+        'select': sorted(select or [])
+    }
+
+    with open(path.join(shard_folderpath, SHARD_MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f)
+
+
+def completed_shards(folderpath):
+    """Verifies that every shard under folderpath is present and complete,
+    and that shards agree on the number of shards and selection
+
+    :param folderpath: the folder containing shard subdirectories
+    :return: a list of (shard subdirectory name, manifest) ordered by shard index
+    """
+    manifest_filepaths = glob(path.join(folderpath, 'shard-*', SHARD_MANIFEST_FILENAME))
+    if len(manifest_filepaths) == 0:
+        raise ValueError('no completed shard found in {}'.format(folderpath))
+
+    manifests = {}
+    for fp in manifest_filepaths:
+        with open(fp) as f:
+            manifest = json.load(f)
+        manifests[manifest['shard_index']] = (path.basename(path.dirname(fp)), manifest)
+
+    num_shards = {m['num_shards'] for _, m in manifests.values()}
+    if len(num_shards) != 1:
+        raise ValueError('shards disagree on the number of shards: {}'.format(sorted(num_shards)))
+    num_shards = num_shards.pop()
+
+    selections = {tuple(m['select']) for _, m in manifests.values()}
+    if len(selections) != 1:
+        raise ValueError('shards were run with different selections: {}'.format(sorted(selections)))
+
+    missing = sorted(set(range(num_shards)) - set(manifests))
+    if missing:
+        raise ValueError('shards {} of {} are missing or incomplete'.format(missing, num_shards))
+
+    return [manifests[shard_index] for shard_index in range(num_shards)]
+
+
+def merge_shard_fragments(folderpath, fragment_filename, id_column='id', relocate_columns=()):
+    """Concatenates fragment_filename of all shards under folderpath after verifying that
+    every shard is present and complete, shard fragments agree on the number of shards and selection,
+    and every record belongs to the shard that wrote it
+
+    :param folderpath: the folder containing shard subdirectories
+    :param fragment_filename: the csv file to merge, e.g. index.csv
+    :param id_column: the grasp id column of the fragment
+    :param relocate_columns: columns of filepaths relative to the shard subdirectory,
+                             which are rewritten to be relative to folderpath
+    :return: merged dataframe sorted by grasp id
+    """
+    shards = completed_shards(folderpath)
+    num_shards = len(shards)
+
+    fragments = []
+    for shard_index, (dirname, manifest) in enumerate(shards):
+        # a shard may legitimately have no record, e.g. when everything it was assigned is deselected
+        if manifest['num_records'] == 0:
+            continue
+
+        fragment = pd.read_csv(path.join(folderpath, dirname, fragment_filename))
+
+        if len(fragment) != manifest['num_records']:
+            raise ValueError('{} of {} has {} records, {} expected'
+                             .format(fragment_filename, dirname, len(fragment), manifest['num_records']))
+
+        not_attempted = set(fragment[id_column]) - set(manifest['attempted_grasp_ids'])
+        wrong_shard = [g for g in fragment[id_column] if shard_of(g, num_shards) != shard_index]
+        if not_attempted or wrong_shard:
+            raise ValueError('{} of {} contains grasps not assigned to it: {}'
+                             .format(fragment_filename, dirname, sorted(not_attempted | set(wrong_shard))))
+
+        for c in relocate_columns:
+            fragment[c] = [path.join(dirname, fp) for fp in fragment[c]]
+
+        fragments.append(fragment)
+
+    if len(fragments) == 0:
+        raise ValueError('all shards in {} are empty'.format(folderpath))
+
+    merged = pd.concat(fragments, ignore_index=True)
+
+    duplicated = merged[id_column][merged[id_column].duplicated()]
+    if len(duplicated) > 0:
+        raise ValueError('grasps {} appear in more than one shard'.format(sorted(duplicated)))
+
+    return merged.sort_values(by=[id_column])
@@ -0,0 +1,153 @@
+import json
+import os
+
+import numpy as np
+
+STATS_FILENAME = 'stats.json'
+
+
+class ColumnStats(object):
+    """Mergeable running count, mean, variance, min and max of several columns,
+    batches are folded in with the parallel form of Welford's algorithm (Chan et al.),
+    so stats of disjoint sets of frames can be combined exactly regardless of order
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        m = len(self.columns)
+        self.count = 0
+        self.mean = np.zeros(m)
+        self.m2 = np.zeros(m)  # sum of squared deviations from the mean
+        self.min = np.full(m, np.inf)
+        self.max = np.full(m, -np.inf)
+
+    @property
+    def std(self):
+        """Population standard deviation
+        """
+        if self.count == 0:
+            return np.full(len(self.columns), np.nan)
+        return np.sqrt(self.m2 / self.count)
+
+    def _combine(self, count, mean, m2, min, max):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / float(total))
+        self.m2 = self.m2 + m2 + delta * delta * (self.count * count / float(total))
+        self.min = np.minimum(self.min, min)
+        self.max = np.maximum(self.max, max)
+        self.count = total
+
+    def update(self, values):
+        """
+        :param values: a nxm matrix of n frames of the m columns
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+
+        mean = values.mean(axis=0)
+        self._combine(len(values), mean, ((values - mean) ** 2).sum(axis=0), values.min(axis=0), values.max(axis=0))
+
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError('cannot merge stats of columns {} into stats of columns {}'
+                             .format(other.columns, self.columns))
+        if other.count > 0:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'columns': {c: {'mean': self.mean[i], 'std': self.std[i], 'm2': self.m2[i],
+                            'min': self.min[i], 'max': self.max[i]}
+                        for i, c in enumerate(self.columns)}
+        }
+
+    @staticmethod
+    def from_dict(d):
+        stats = ColumnStats(list(d['columns']))
+        stats.count = d['count']
+        for i, c in enumerate(stats.columns):
+            stats.mean[i] = d['columns'][c]['mean']
+            stats.m2[i] = d['columns'][c]['m2']
+            stats.min[i] = d['columns'][c]['min']
+            stats.max[i] = d['columns'][c]['max']
+        return stats
+
+
+class DatasetStats(object):
+    """Frame statistics of gripper motor and polaris columns, overall, per grip type and per session date,
+    and grasp counts per grip type and status
+    """
+
+    def __init__(self):
+        self.columns = None
+        self.groups = {}  # group name, e.g. overall, grip_type=12, session_date=2018-07-25 => ColumnStats
+        self.grasp_counts = {'grip_type': {}, 'is_success': {}}
+
+    def _group(self, name):
+        if name not in self.groups:
+            self.groups[name] = ColumnStats(self.columns)
+        return self.groups[name]
+
+    def update(self, processed_grasp, gripper_df):
+        """Folds a processed grasp into the statistics
+
+        :param processed_grasp: the index record of the grasp, with session_date as a pd.Timestamp
+        :param gripper_df: merged gripper motor and polaris data of the grasp
+        """
+        columns = [c for c in gripper_df.columns if c.startswith('gripper_motor_') or c.startswith('polaris_')]
+        if self.columns is None:
+            self.columns = columns
+        elif columns != self.columns:
+            raise ValueError('gripper data columns {} differ from columns {} of previous grasps'
+                             .format(columns, self.columns))
+
+        values = gripper_df[self.columns].values
+        for name in ('overall',
+                     'grip_type={}'.format(processed_grasp['grip_type']),
+                     'session_date={}'.format(processed_grasp['session_date'].strftime('%Y-%m-%d'))):
+            self._group(name).update(values)
+
+        for key in ('grip_type', 'is_success'):
+            value = str(processed_grasp[key])
+            self.grasp_counts[key][value] = self.grasp_counts[key].get(value, 0) + 1
+
+    def merge(self, other):
+        """Merges statistics of another disjoint set of grasps, e.g. of another shard or an earlier run
+        """
+        if other.columns is None:
+            return
+        if self.columns is None:
+            self.columns = other.columns
+
+        for name, stats in other.groups.items():
+            self._group(name).merge(stats)
+
+        for key, counts in other.grasp_counts.items():
+            for value, count in counts.items():
+                self.grasp_counts[key][value] = self.grasp_counts[key].get(value, 0) + count
+
+    def save(self, filepath):
+        stats = {
+            'columns': self.columns,
+            'grasp_counts': self.grasp_counts,
+            'groups': {name: s.to_dict() for name, s in sorted(self.groups.items())}
+        }
+
+        # write to a temporary file and rename, so that readers never see a partially written file
+        with open(filepath + '.tmp', 'w') as f:
+            json.dump(stats, f, indent=2, default=float)
+        os.replace(filepath + '.tmp', filepath)
+
+    @staticmethod
+    def load(filepath):
+        with open(filepath) as f:
+            d = json.load(f)
+
+        stats = DatasetStats()
+        stats.columns = d['columns']
+        stats.grasp_counts = d['grasp_counts']
+        stats.groups = {name: ColumnStats.from_dict(g) for name, g in d['groups'].items()}
+        return stats
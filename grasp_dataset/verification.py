@@ -0,0 +1,162 @@
+"""Comparison of the fast merge path of index_dataset.py with the legacy reference implementation
+
+the reference transforms polaris frames one at a time with Transformer.transform_single_example and
+evaluates cubic interp1d interpolations of gripper motor records one polaris timestamp at a time,
+exactly as index_dataset.py did before it was vectorized; it is kept here, frozen, as ground truth
+
+only the merge at polaris timestamps with axis angle orientations has a legacy counterpart, so that is the
+configuration verified whatever --merge-mode and --orientation index_dataset.py runs with
+"""
+import json
+import os
+
+import numpy as np
+from scipy.interpolate import interp1d
+from scipy.spatial.transform import Rotation
+
+VERIFICATION_FILENAME = 'verification.json'
+
+# the merge mode and orientation representation compared with the legacy path
+VERIFIED_MERGE_MODE = 'polaris'
+VERIFIED_ORIENTATION = 'axis_angle'
+
+# stages timed in both paths
+STAGES = ('transform', 'interpolate')
+
+# compared quantity => merged gripper data columns
+_QUANTITY_COLUMNS = {
+    'gripper_motor': ['gripper_motor_1', 'gripper_motor_2', 'gripper_motor_3', 'gripper_motor_4'],
+    'polaris_position': ['polaris_x', 'polaris_y', 'polaris_z'],
+    'polaris_orientation': ['polaris_rx', 'polaris_ry', 'polaris_rz']
+}
+
+
+def legacy_transform(polaris_coord_transformer, tool1_params, tool2_params):
+    """
+    :return: a nx6 matrix of positions and axis angles, transformed frame by frame
+    """
+    polaris_records = [polaris_coord_transformer.transform_single_example(t1, t2)
+                       for t1, t2 in zip(tool1_params, tool2_params)]
+    return np.array(polaris_records)
+
+
+def legacy_interpolate(gripper_ts, gripper_motor_records, polaris_ts):
+    """
+    :return: a nx4 matrix of gripper motor records interpolated at polaris timestamps, one timestamp at a time
+    """
+    gripper_ts_values = np.array([t.value for t in gripper_ts])
+    interps = [interp1d(gripper_ts_values, gripper_motor_records[:, ci], fill_value='extrapolate', kind='cubic')
+               for ci in range(gripper_motor_records.shape[1])]
+
+    records = np.zeros(shape=(len(polaris_ts), gripper_motor_records.shape[1]))
+    for i, ts in enumerate(polaris_ts):
+        records[i] = np.array([f(ts.value) for f in interps])
+
+    return records
+
+
+def merged_frame_deviations(reference_df, fast_df):
+    """Max deviations between two merged gripper data frames of the same timestamps with axis angle orientations,
+    orientations are compared as the angle of the rotation between them, since axis angles of rotations by
+    about pi may flip sign without changing the rotation
+
+    :return: a dict of quantity => max deviation, in motor units, mm and radians
+    """
+    if len(reference_df) != len(fast_df) or not np.array_equal(reference_df['timestamp'].values,
+                                                                fast_df['timestamp'].values):
+        raise ValueError('reference and fast merged frames have different timestamps')
+
+    deviations = {}
+    for quantity in ('gripper_motor', 'polaris_position'):
+        columns = _QUANTITY_COLUMNS[quantity]
+        deviations[quantity] = float(np.max(np.abs(reference_df[columns].values - fast_df[columns].values),
+                                            initial=0.0))
+
+    columns = _QUANTITY_COLUMNS['polaris_orientation']
+    relative = (Rotation.from_rotvec(reference_df[columns].values).inv()
+                * Rotation.from_rotvec(fast_df[columns].values))
+    deviations['polaris_orientation'] = float(np.max(relative.magnitude(), initial=0.0))
+
+    return deviations
+
+
+class VerificationReport(object):
+    """Accumulates timings and deviations of verified grasps
+    """
+
+    def __init__(self, tolerances):
+        """
+        :param tolerances: a dict of quantity => max deviation, see merged_frame_deviations
+        """
+        self.tolerances = tolerances
+        self.seconds = {stage: {'legacy': 0.0, 'fast': 0.0} for stage in STAGES}
+        self.max_deviations = {quantity: 0.0 for quantity in tolerances}
+        self.verified_grasp_ids = []
+        self.deviating_grasp_ids = []
+        self.legacy_failures = {}  # grasp id => error of the legacy path
+
+    def add(self, grasp_id, legacy_seconds, fast_seconds, deviations):
+        """
+        :param legacy_seconds: a dict of stage => seconds spent in the legacy path
+        :param fast_seconds: a dict of stage => seconds spent in the fast path
+        :param deviations: see merged_frame_deviations
+        :return: True if all deviations are within tolerances
+        """
+        for stage in STAGES:
+            self.seconds[stage]['legacy'] += legacy_seconds[stage]
+            self.seconds[stage]['fast'] += fast_seconds[stage]
+
+        for quantity, deviation in deviations.items():
+            self.max_deviations[quantity] = max(self.max_deviations[quantity], deviation)
+
+        self.verified_grasp_ids.append(grasp_id)
+        within_tolerances = all(deviations[q] <= t for q, t in self.tolerances.items())
+        if not within_tolerances:
+            self.deviating_grasp_ids.append(grasp_id)
+
+        return within_tolerances
+
+    def add_legacy_failure(self, grasp_id, error):
+        self.legacy_failures[grasp_id] = str(error)
+
+    def speedup(self, stage):
+        if self.seconds[stage]['fast'] == 0:
+            return float('nan')
+        return self.seconds[stage]['legacy'] / self.seconds[stage]['fast']
+
+    def summary(self):
+        """
+        :return: a printable multi-line summary
+        """
+        lines = ['verified {} grasps against the legacy path, {} outside tolerances, {} failed in the legacy path'
+                 .format(len(self.verified_grasp_ids), len(self.deviating_grasp_ids), len(self.legacy_failures)),
+                 '  only --merge-mode {} with --orientation {} is verified'
+                 .format(VERIFIED_MERGE_MODE, VERIFIED_ORIENTATION)]
+        for stage in STAGES:
+            lines.append('  {:<12} legacy {:9.4f}s  fast {:9.4f}s  speedup {:8.1f}x'
+                         .format(stage, self.seconds[stage]['legacy'], self.seconds[stage]['fast'],
+                                 self.speedup(stage)))
+        for quantity, tolerance in sorted(self.tolerances.items()):
+            lines.append('  {:<20} max deviation {:.3g}, tolerance {:.3g}'
+                         .format(quantity, self.max_deviations[quantity], tolerance))
+        if self.deviating_grasp_ids:
+            lines.append('  grasps outside tolerances: {}'.format(' '.join(str(i) for i in self.deviating_grasp_ids)))
+
+        return '\n'.join(lines)
+
+    def save(self, filepath):
+        report = {
+            'merge_mode': VERIFIED_MERGE_MODE,
+            'orientation': VERIFIED_ORIENTATION,
+            'tolerances': self.tolerances,
+            'max_deviations': self.max_deviations,
+            'seconds': self.seconds,
+            'speedups': {stage: self.speedup(stage) for stage in STAGES},
+            'verified_grasp_ids': self.verified_grasp_ids,
+            'deviating_grasp_ids': self.deviating_grasp_ids,
+            'legacy_failures': {str(k): v for k, v in self.legacy_failures.items()}
+        }
+
+        with open(filepath + '.tmp', 'w') as f:
+            json.dump(report, f, indent=2, default=int)
+        os.replace(filepath + '.tmp', filepath)
@@ -0,0 +1,104 @@
+import logging
+import os
+import time
+from fnmatch import fnmatch
+from os import path
+
+
+class GraspFileWatcher(object):
+    """Polls an input folder for grasps whose files are complete and no longer being written
+
+    a directory is only listed again when its mtime changes, i.e. when entries are added, removed or renamed
+    in it, so an idle poll costs one stat per directory plus one stat per file of grasps still incomplete
+    """
+
+    def __init__(self, input_folderpath, filetypes, settle_seconds=0.5):
+        """
+        :param input_folderpath: the folder to watch, recursively
+        :param filetypes: filetype name => (filename pattern, a function to extract grasp id from filename),
+                          a grasp is complete once it has one file of every filetype
+        :param settle_seconds: a grasp is stable once none of its files was modified for this long
+        """
+        self.input_folderpath = input_folderpath
+        self.filetypes = filetypes
+        self.settle_seconds = settle_seconds
+
+        self._dir_mtimes = {input_folderpath: None}  # directory => mtime when it was last listed
+        self._known_filepaths = set()
+        self._grasp_files = {}  # grasp id => {filetype name: filepath relative to input folder}
+        self._pending_grasp_ids = set()  # grasps with new files which have not been emitted yet
+
+    def _match_filetype(self, filename):
+        for filetype, (pattern, extract_grasp_id) in self.filetypes.items():
+            if fnmatch(filename, pattern):
+                try:
+                    return filetype, extract_grasp_id(filename)
+                except ValueError:
+                    logging.warning('cannot extract grasp id from %s', filename)
+                    return None
+        return None
+
+    def _list_changed_directories(self):
+        changed = []
+        for d, last_mtime in list(self._dir_mtimes.items()):
+            try:
+                mtime = os.stat(d).st_mtime_ns
+            except FileNotFoundError:
+                del self._dir_mtimes[d]
+                continue
+            if mtime != last_mtime:
+                # record the mtime before listing, a change during listing is picked up by the next poll
+                self._dir_mtimes[d] = mtime
+                changed.append(d)
+
+        while changed:
+            d = changed.pop()
+            for entry in os.scandir(d):
+                if entry.is_dir():
+                    if entry.path not in self._dir_mtimes:
+                        self._dir_mtimes[entry.path] = entry.stat().st_mtime_ns
+                        changed.append(entry.path)
+                    continue
+
+                if entry.path in self._known_filepaths:
+                    continue
+                self._known_filepaths.add(entry.path)
+
+                matched = self._match_filetype(entry.name)
+                if matched is None:
+                    continue
+
+                filetype, grasp_id = matched
+                self._grasp_files.setdefault(grasp_id, {})[filetype] = path.relpath(entry.path,
+                                                                                   self.input_folderpath)
+                self._pending_grasp_ids.add(grasp_id)
+
+    def poll(self):
+        """
+        :return: a list of records of complete and stable grasps not returned before, sorted by grasp id,
+                 each record has grasp_id and a filepath for every filetype, like _group_files_by_grasp_id
+        """
+        self._list_changed_directories()
+
+        ready = []
+        now = time.time()
+        for grasp_id in sorted(self._pending_grasp_ids):
+            files = self._grasp_files[grasp_id]
+            if len(files) < len(self.filetypes):
+                continue
+
+            try:
+                last_modified = max(os.stat(path.join(self.input_folderpath, fp)).st_mtime for fp in files.values())
+            except FileNotFoundError:
+                continue
+
+            if now - last_modified < self.settle_seconds:
+                continue
+
+            record = {'grasp_id': grasp_id}
+            record.update(files)
+            ready.append(record)
+
+        self._pending_grasp_ids.difference_update(r['grasp_id'] for r in ready)
+
+        return ready
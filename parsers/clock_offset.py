@@ -0,0 +1,71 @@
+import numpy as np
+from scipy import fft
+
+from parsers.polaris_interp import timestamps_to_ns
+
+
+def _activity(ts_values, values, grid, sample_seconds):
+    """Resamples values linearly onto grid and computes their speed, zero-mean within the time span of ts_values
+    and zero outside
+
+    :param ts_values: int64 timestamps in nanoseconds, increasing
+    :param values: a nxk matrix of values at ts_values
+    :param grid: int64 timestamps of the grid, sample_seconds apart
+    :return: an array of speeds at grid points
+    """
+    # values are held constant outside ts_values, so there is no spurious speed at either end
+    resampled = np.stack([np.interp(grid, ts_values, values[:, ci]) for ci in range(values.shape[1])], axis=1)
+    speed = np.linalg.norm(np.gradient(resampled, sample_seconds, axis=0), axis=1)
+
+    inside = (grid >= ts_values[0]) & (grid <= ts_values[-1])
+    speed[~inside] = 0
+    if np.any(inside):
+        speed[inside] -= speed[inside].mean()
+    return speed
+
+
+def estimate_clock_offset(gripper_ts, gripper_motor_2, polaris_ts, polaris_positions,
+                          max_offset_seconds=0.5, sample_seconds=0.01):
+    """Estimates the residual clock offset between gripper and polaris recordings by cross-correlating
+    the closure speed of gripper motor 2 with the polaris motion speed, both resampled to a common grid,
+    the correlation is computed for all lags at once by FFT and its peak is searched within max_offset_seconds
+
+    :param gripper_ts: timestamps of gripper records, synchronized by the time difference if known
+    :param gripper_motor_2: gripper motor 2 records
+    :param polaris_ts: timestamps of polaris records
+    :param polaris_positions: a nx3 matrix of gripper center positions from polaris records, raw tool positions
+                              jump when the recorded tool switches
+    :param max_offset_seconds: the offset is searched within [-max_offset_seconds, max_offset_seconds]
+    :param sample_seconds: step of the common grid, and resolution of the estimated offset
+    :return: (offset in nanoseconds to add to gripper timestamps, confidence), confidence is the normalized
+             correlation at the offset, in [-1, 1], 0 if either signal is constant
+    """
+    gripper_ts_values = timestamps_to_ns(gripper_ts)
+    polaris_ts_values = timestamps_to_ns(polaris_ts)
+
+    step = int(round(sample_seconds * 1e9))
+    max_lag = int(round(max_offset_seconds / sample_seconds))
+    start = min(gripper_ts_values[0], polaris_ts_values[0])
+    end = max(gripper_ts_values[-1], polaris_ts_values[-1])
+    grid = start + step * np.arange((end - start) // step + 1, dtype=np.int64)
+
+    gripper_signal = _activity(gripper_ts_values, np.asarray(gripper_motor_2, dtype=np.float64)[:, None], grid,
+                               sample_seconds)
+    polaris_signal = _activity(polaris_ts_values, np.asarray(polaris_positions, dtype=np.float64), grid,
+                               sample_seconds)
+
+    norm = np.linalg.norm(gripper_signal) * np.linalg.norm(polaris_signal)
+    if norm == 0:
+        return 0, 0.0
+
+    # correlation[lag] = sum_t gripper_signal[t] * polaris_signal[t + lag], negative lags wrap around to the end,
+    # zero padding to n >= 2 * len(grid) - 1 avoids circular overlap
+    n = fft.next_fast_len(2 * len(grid) - 1, real=True)
+    correlation = fft.irfft(np.conj(fft.rfft(gripper_signal, n)) * fft.rfft(polaris_signal, n), n)
+
+    max_lag = min(max_lag, len(grid) - 1)
+    lags = np.arange(-max_lag, max_lag + 1)
+    windowed = correlation[lags % n]
+    best = np.argmax(windowed)
+
+    return int(lags[best]) * step, float(windowed[best] / norm)
@@ -5,12 +5,15 @@ import pandas as pd
 
 import logging
 
-# an encapsulation of parsed gripper file
-ParsedGripperFile = namedtuple('ParsedGripperFile', 'timestamps motor_records grip_type desc is_grip_success')
+# an encapsulation of parsed gripper file, time_delta is None if the file has no time difference
+ParsedGripperFile = namedtuple('ParsedGripperFile',
+                               'timestamps motor_records grip_type desc is_grip_success time_delta')
 
 
 # extracts timestamps, motor_records, grip_type, description, success_status from gripper file
-def parse_gripper_file(filepath):
+# timestamps are synchronized with polaris by the time difference in the file, if require_time_difference is False,
+# a file without time difference is accepted and its timestamps are left unsynchronized
+def parse_gripper_file(filepath, require_time_difference=True):
     timestamps = []
     motor_records = []
     grip_desc = ''
@@ -53,8 +56,10 @@ def parse_gripper_file(filepath):
     if (len(motor_records) < 2):
         raise ValueError('too few motor recordings for interpolation')
 
-    if timestamps is None:
-        raise ValueError('time difference is not found in gripper file %s', filepath)
+    if time_delta is None:
+        if require_time_difference:
+            raise ValueError('time difference is not found in gripper file {}'.format(filepath))
+        logging.warning('time difference is not found in gripper file %s', filepath)
 
     motor_records = np.stack(motor_records, axis=0)  # a nx4 matrix of n motor records
     # interpolates 0s for 4 columns and re-stack to produces a 4xn matrix
@@ -63,12 +68,13 @@ def parse_gripper_file(filepath):
     motor_records = np.transpose(motor_records)   # transpose to produce nx4 matrix
 
     # synchronize time with polaris
-    timestamps = [(t + time_delta) for t in timestamps]
+    if time_delta is not None:
+        timestamps = [(t + time_delta) for t in timestamps]
     timestamps = np.array(timestamps)
 
     desc = '{} {}'.format(grip_desc, status_desc)
 
-    return ParsedGripperFile(timestamps, motor_records, grip_type, desc, is_grip_success)
+    return ParsedGripperFile(timestamps, motor_records, grip_type, desc, is_grip_success, time_delta)
 
 
 def _interpolate_zeros(series):
@@ -105,6 +105,109 @@ def rotation_matrix_from_quaternions(q_vector):
     return R
 
 
+def rotation_matrices_from_quaternions(q):
+
+    '''
+    :param q: array of shape nx4, each row a unit quaternion [qr, qx, qy, qz]
+    :return: an array of shape nx3x3 of rotation matrices, see rotation_matrix_from_quaternions
+    '''
+
+    qr, qi, qj, qk = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    R = np.empty((len(q), 3, 3))
+    R[:, 0, 0] = 1 - 2 * (qj * qj + qk * qk)
+    R[:, 0, 1] = 2 * (qi * qj - qk * qr)
+    R[:, 0, 2] = 2 * (qi * qk + qj * qr)
+    R[:, 1, 0] = 2 * (qi * qj + qk * qr)
+    R[:, 1, 1] = 1 - 2 * (qi * qi + qk * qk)
+    R[:, 1, 2] = 2 * (qj * qk - qi * qr)
+    R[:, 2, 0] = 2 * (qi * qk - qj * qr)
+    R[:, 2, 1] = 2 * (qj * qk + qi * qr)
+    R[:, 2, 2] = 1 - 2 * (qi * qi + qj * qj)
+    return R
+
+
+def rotation_matrices_to_quaternions(R):
+
+    '''
+    Shepperd's method, the quaternion component with the largest magnitude is computed from the diagonal
+    and the others are divided by it, so no division by a small number happens for any rotation
+
+    :param R: array of shape nx3x3 of rotation matrices
+    :return: array of shape nx4 of unit quaternions [qr, qx, qy, qz] with qr >= 0
+    '''
+
+    r00, r01, r02 = R[:, 0, 0], R[:, 0, 1], R[:, 0, 2]
+    r10, r11, r12 = R[:, 1, 0], R[:, 1, 1], R[:, 1, 2]
+    r20, r21, r22 = R[:, 2, 0], R[:, 2, 1], R[:, 2, 2]
+
+    # 4 * squared magnitude of qr, qx, qy, qz
+    diag = np.stack([1 + r00 + r11 + r22,
+                     1 + r00 - r11 - r22,
+                     1 - r00 + r11 - r22,
+                     1 - r00 - r11 + r22], axis=1)
+    largest = np.argmax(diag, axis=1)
+    # 4 * the largest component, at least 1 for any rotation matrix
+    d = 2 * np.sqrt(np.maximum(diag[np.arange(len(R)), largest], 0))
+
+    # candidates[c] is the quaternion computed from component c, scaled by 4 * component c
+    candidates = np.stack([
+        np.stack([d * d / 4, r21 - r12, r02 - r20, r10 - r01], axis=1),
+        np.stack([r21 - r12, d * d / 4, r01 + r10, r02 + r20], axis=1),
+        np.stack([r02 - r20, r01 + r10, d * d / 4, r12 + r21], axis=1),
+        np.stack([r10 - r01, r02 + r20, r12 + r21, d * d / 4], axis=1)], axis=1)
+    q = candidates[np.arange(len(R)), largest] / d[:, None]
+
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+    # q and -q encode the same rotation, pick the one with non-negative real part
+    return np.where(q[:, 0:1] < 0, -q, q)
+
+
+def rotation_matrices_to_axis_angles(R):
+
+    '''
+    Computes axis * angle through the quaternion of R, angle = 2 * atan2(|v|, qr) where v = [qx, qy, qz],
+    which unlike acos of the trace is well conditioned near 0 and pi
+
+    :param R: array of shape nx3x3 of rotation matrices
+    :return: array of shape nx3 of axis-angle vectors, see rotmat_to_axis_angle
+    '''
+
+    q = rotation_matrices_to_quaternions(R)
+    v = q[:, 1:4]
+    sin_half_angle = np.linalg.norm(v, axis=1)
+    angle = 2 * np.arctan2(sin_half_angle, q[:, 0])
+
+    # angle / sin(angle / 2) tends to 2 / qr as the angle tends to 0
+    # (qr >= 0.5 whenever sin(angle / 2) is small since q is a unit quaternion)
+    is_small = sin_half_angle < 1e-8
+    scale = np.where(is_small,
+                     2 / np.where(is_small, q[:, 0], 1),
+                     angle / np.where(is_small, 1, sin_half_angle))
+    return v * scale[:, None]
+
+
+def rotation_matrices_to_6d(R):
+
+    '''
+    The continuous 6D representation of rotations, i.e. the first two columns of R
+
+    :param R: array of shape nx3x3 of rotation matrices
+    :return: array of shape nx6, [r00, r10, r20, r01, r11, r21]
+    '''
+
+    return np.concatenate([R[:, :, 0], R[:, :, 1]], axis=1)
+
+
+# orientation representation => (column suffixes, conversion from an nx3x3 array of rotation matrices)
+ORIENTATION_REPRESENTATIONS = {
+    'axis_angle': (['rx', 'ry', 'rz'], rotation_matrices_to_axis_angles),
+    'quaternion': (['qr', 'qx', 'qy', 'qz'], rotation_matrices_to_quaternions),
+    'rotation_matrix': (['r00', 'r01', 'r02', 'r10', 'r11', 'r12', 'r20', 'r21', 'r22'],
+                        lambda R: R.reshape(len(R), 9)),
+    'rotation_6d': (['r6d_0', 'r6d_1', 'r6d_2', 'r6d_3', 'r6d_4', 'r6d_5'], rotation_matrices_to_6d)
+}
+
+
 def homogenous_transform(R,vect):
 
     '''
@@ -383,3 +486,32 @@ class Transformer(object):
 
         return (x, y, z, Rx, Ry, Rz)
 
+    def transform_batch(self, tool1_params, tool2_params, orientation='axis_angle'):
+
+        '''
+        transform_single_example over all frames at once
+
+        :param tool1_params: array of shape nx7, [x, y, z, qr, qx, qy, qz] of tool 1 (449)
+        :param tool2_params: array of shape nx7, [x, y, z, qr, qx, qy, qz] of tool 2 (339)
+        :param orientation: a key of ORIENTATION_REPRESENTATIONS
+        :return: array of shape nx(3+k), positions followed by k orientation components
+        '''
+
+        use_tool1 = np.any(tool1_params, axis=1)
+        params = np.where(use_tool1[:, None], tool1_params, tool2_params)
+
+        H = np.zeros((len(params), 4, 4))
+        H[:, 0:3, 0:3] = rotation_matrices_from_quaternions(params[:, 3:7])
+        H[:, 0:3, 3] = params[:, 0:3]
+        H[:, 3, 3] = 1
+
+        use_339 = np.any(tool2_params, axis=1)
+        H_to_gripper_center = np.where(use_339[:, None, None],
+                                       self.st.HT_from339_to_gripper_center,
+                                       self.st.HT_from449_to_gripper_center)
+
+        H_origin = np.matmul(self.st.Inverse_HT_object, np.matmul(H, H_to_gripper_center))
+
+        _, to_orientation = ORIENTATION_REPRESENTATIONS[orientation]
+        return np.concatenate([H_origin[:, 0:3, 3], to_orientation(H_origin[:, 0:3, 0:3])], axis=1)
+
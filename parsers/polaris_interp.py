@@ -0,0 +1,97 @@
+import numpy as np
+
+
+def timestamps_to_ns(timestamps):
+    """Converts an iterable of pandas timestamps to an int64 array of nanoseconds
+
+    :param timestamps: an iterable of pd.Timestamp
+    :return: an int64 numpy array of nanoseconds since epoch
+    """
+    return np.array([t.value for t in timestamps], dtype=np.int64)
+
+
+def bracket(source_ts, target_ts):
+    """Finds the pair of source samples enclosing each target timestamp via binary search
+
+    :param source_ts: a sorted int64 array of n source timestamps, n >= 2
+    :param target_ts: an int64 array of m target timestamps
+    :return: (i0, i1, alpha, in_range), i0 and i1 index the left and right source samples, alpha is the
+             fractional position of the target between them, in_range is False for targets outside source_ts
+    """
+    if len(source_ts) < 2:
+        raise ValueError('too few polaris recordings for interpolation')
+
+    i1 = np.clip(np.searchsorted(source_ts, target_ts, side='right'), 1, len(source_ts) - 1)
+    i0 = i1 - 1
+
+    span = (source_ts[i1] - source_ts[i0]).astype(np.float64)
+    offset = (target_ts - source_ts[i0]).astype(np.float64)
+    # duplicated source timestamps have zero span, snap to the left sample
+    alpha = np.divide(offset, span, out=np.zeros_like(offset), where=span > 0)
+    alpha = np.clip(alpha, 0.0, 1.0)
+
+    in_range = (target_ts >= source_ts[0]) & (target_ts <= source_ts[-1])
+
+    return i0, i1, alpha, in_range
+
+
+def slerp(q0, q1, alpha):
+    """Spherical linear interpolation between two batches of quaternions
+
+    :param q0: a nx4 matrix of quaternions (qr, qi, qj, qk)
+    :param q1: a nx4 matrix of quaternions (qr, qi, qj, qk)
+    :param alpha: an array of n interpolation fractions in [0, 1]
+    :return: a nx4 matrix of unit quaternions
+    """
+    q0 = q0 / np.linalg.norm(q0, axis=1, keepdims=True)
+    q1 = q1 / np.linalg.norm(q1, axis=1, keepdims=True)
+
+    # q and -q encode the same rotation, flip q1 to interpolate along the shorter arc
+    dot = np.sum(q0 * q1, axis=1)
+    q1 = np.where((dot < 0)[:, None], -q1, q1)
+    dot = np.clip(np.abs(dot), 0.0, 1.0)
+
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+
+    # fall back to linear interpolation when quaternions are (nearly) parallel
+    is_parallel = sin_theta < 1e-6
+    safe_sin_theta = np.where(is_parallel, 1.0, sin_theta)
+    w0 = np.where(is_parallel, 1.0 - alpha, np.sin((1.0 - alpha) * theta) / safe_sin_theta)
+    w1 = np.where(is_parallel, alpha, np.sin(alpha * theta) / safe_sin_theta)
+
+    q = w0[:, None] * q0 + w1[:, None] * q1
+
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def interpolate_tool_params(tool_params, i0, i1, alpha):
+    """Interpolates polaris tool parameters (x, y, z, q0, qx, qy, qz) between bracketing samples
+    positions are interpolated linearly and orientations by slerp, if one of the bracketing samples
+    is all zeros (i.e. the tool was out of volume), the nearest sample is used instead
+
+    :param tool_params: a nx7 matrix of polaris tool parameters
+    :param i0: indices of the left bracketing samples, see bracket
+    :param i1: indices of the right bracketing samples, see bracket
+    :param alpha: fractional positions between bracketing samples, see bracket
+    :return: a mx7 matrix of interpolated tool parameters
+    """
+    p0 = tool_params[i0]
+    p1 = tool_params[i1]
+
+    is_zero = ~np.any(tool_params, axis=1)
+    has_zero_end = is_zero[i0] | is_zero[i1]
+
+    interpolated = np.zeros((len(alpha), 7), dtype=np.float64)
+
+    # interpolate only where both bracketing samples are valid recordings
+    valid = ~has_zero_end
+    a = alpha[valid]
+    interpolated[valid, 0:3] = (1.0 - a)[:, None] * p0[valid, 0:3] + a[:, None] * p1[valid, 0:3]
+    interpolated[valid, 3:7] = slerp(p0[valid, 3:7], p1[valid, 3:7], a)
+
+    # otherwise take the nearest sample, which may itself be all zeros
+    nearest = np.where(alpha < 0.5, i0, i1)
+    interpolated[has_zero_end] = tool_params[nearest[has_zero_end]]
+
+    return interpolated
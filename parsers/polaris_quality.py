@@ -0,0 +1,115 @@
+import numpy as np
+
+from parsers.polaris_interp import timestamps_to_ns
+from parsers.polaris_parser import ParsedPolarisFile
+
+
+def _selected_tool_params(tool1_params, tool2_params):
+    """Selects tool1 params if they are non-zero, otherwise tool2 params, as Transformer does
+
+    :return: (a nx7 matrix of selected tool params, a boolean array which is True where tool1 is selected)
+    """
+    use_tool1 = np.any(tool1_params, axis=1)
+    return np.where(use_tool1[:, None], tool1_params, tool2_params), use_tool1
+
+
+def _velocity_jump_mask(ts_values, positions, tools, max_speed):
+    """Flags isolated frames whose position jumps away from both neighbouring frames faster than max_speed,
+    a single outlier produces a jump in and a jump out, while a genuine fast motion only produces one
+
+    :param ts_values: int64 timestamps in nanoseconds, strictly increasing
+    :param positions: a nx3 matrix of tool positions in mm
+    :param tools: an array identifying the tool of each frame, jumps between different tools are not compared
+    :param max_speed: max plausible speed in mm per second
+    :return: a boolean array, True for frames that jump
+    """
+    n = len(ts_values)
+    is_jump = np.zeros(n, dtype=bool)
+    # with two frames there is no telling which one is the outlier
+    if n < 3:
+        return is_jump
+
+    seconds = np.diff(ts_values) / 1e9
+    speeds = np.linalg.norm(np.diff(positions, axis=0), axis=1) / seconds
+    # jump[i] is True if the step between frames i and i + 1 is implausible
+    jump = (speeds > max_speed) & (tools[1:] == tools[:-1])
+
+    # interior frames must jump on both sides
+    is_jump[1:-1] = jump[:-1] & jump[1:]
+    # the first and last frames only have one side, they jump if their only neighbour does not
+    is_jump[0] = jump[0] and not jump[1]
+    is_jump[-1] = jump[-1] and not jump[-2]
+
+    return is_jump
+
+
+def polaris_frame_quality(parsed_polaris_file, max_quaternion_norm_error=1e-2, max_speed=1000.0):
+    """Computes a validity mask over all frames of a polaris recording at once,
+    a frame is invalid if
+        * both tools are all zeros
+        * the quaternion of the selected tool is not a unit quaternion
+        * its timestamp is not later than all previous timestamps
+        * its position jumps away from adjacent frames faster than max_speed
+
+    :param parsed_polaris_file: a ParsedPolarisFile
+    :param max_quaternion_norm_error: max deviation of quaternion norm from 1
+    :param max_speed: max plausible tool speed in mm per second
+    :return: (a boolean array which is True for valid frames, a dict of per-grasp quality statistics)
+    """
+    tool1_params = parsed_polaris_file.tool1_params
+    tool2_params = parsed_polaris_file.tool2_params
+    ts_values = timestamps_to_ns(parsed_polaris_file.timestamps)
+    n = len(ts_values)
+
+    selected_params, use_tool1 = _selected_tool_params(tool1_params, tool2_params)
+
+    is_zero_tool = ~np.any(tool1_params, axis=1) & ~np.any(tool2_params, axis=1)
+
+    quaternion_norms = np.linalg.norm(selected_params[:, 3:7], axis=1)
+    is_bad_quaternion = ~is_zero_tool & (np.abs(quaternion_norms - 1.0) > max_quaternion_norm_error)
+
+    # a frame is out of order if an earlier frame has a later or equal timestamp
+    previous_max_ts = np.concatenate([[np.iinfo(np.int64).min], np.maximum.accumulate(ts_values)[:-1]])
+    is_non_monotonic = ts_values <= previous_max_ts
+
+    valid = ~(is_zero_tool | is_bad_quaternion | is_non_monotonic)
+
+    # velocity is only meaningful between frames which passed the checks above
+    valid_inds = np.flatnonzero(valid)
+    is_jump = np.zeros(n, dtype=bool)
+    is_jump[valid_inds] = _velocity_jump_mask(ts_values[valid_inds],
+                                              selected_params[valid_inds, 0:3],
+                                              use_tool1[valid_inds],
+                                              max_speed)
+    valid &= ~is_jump
+
+    stats = {
+        'polaris_frames': n,
+        'polaris_valid_frames': int(np.sum(valid)),
+        'polaris_zero_tool_frames': int(np.sum(is_zero_tool)),
+        'polaris_bad_quaternion_frames': int(np.sum(is_bad_quaternion)),
+        'polaris_non_monotonic_frames': int(np.sum(is_non_monotonic)),
+        'polaris_jump_frames': int(np.sum(is_jump))
+    }
+
+    return valid, stats
+
+
+def gate_polaris_frames(parsed_polaris_file, **thresholds):
+    """Drops invalid frames from a polaris recording, see polaris_frame_quality
+
+    :param parsed_polaris_file: a ParsedPolarisFile
+    :param thresholds: keyword arguments of polaris_frame_quality
+    :return: (a ParsedPolarisFile with valid frames only, a dict of per-grasp quality statistics)
+    """
+    valid, stats = polaris_frame_quality(parsed_polaris_file, **thresholds)
+
+    if stats['polaris_valid_frames'] < 2:
+        raise ValueError('too few valid polaris frames, {} of {} frames are valid'
+                         .format(stats['polaris_valid_frames'], stats['polaris_frames']))
+
+    gated = ParsedPolarisFile(parsed_polaris_file.timestamps[valid],
+                              parsed_polaris_file.tool1_params[valid],
+                              parsed_polaris_file.tool2_params[valid])
+
+    return gated, stats
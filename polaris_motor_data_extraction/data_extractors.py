@@ -1,5 +1,18 @@
 import pandas as pd
 import numpy as np
+from scipy.ndimage import minimum_filter1d, maximum_filter1d
+
+MOTOR_COLUMNS = ['gripper_motor_1', 'gripper_motor_2', 'gripper_motor_3', 'gripper_motor_4']
+# polaris columns of gripper data indexed with the default axis_angle orientation
+POLARIS_COLUMNS = ['polaris_x', 'polaris_y', 'polaris_z', 'polaris_rx', 'polaris_ry', 'polaris_rz']
+
+
+def polaris_columns_of(gripper_data_filepath):
+    """Polaris columns of a gripper data file, whose orientation columns depend on index_dataset.py --orientation
+
+    :return: a list of column names
+    """
+    return [c for c in pd.read_csv(gripper_data_filepath, nrows=0).columns if c.startswith('polaris_')]
 
 
 class PolarisMotorDataExtractor:
@@ -8,8 +21,21 @@ class PolarisMotorDataExtractor:
     """
     _registered_extractor = {}
 
+    @property
+    def required_columns(self):
+        """Columns of gripper data the extractor reads, and their dtypes,
+        only these columns are loaded from gripper data files, None means all columns
+
+        :return: a dict of column name => dtype, or None
+        """
+        return None
+
     def __call__(self, gripper_data_filepath):
-        gripper_df = pd.read_csv(gripper_data_filepath)
+        required_columns = self.required_columns
+        if required_columns is None:
+            gripper_df = pd.read_csv(gripper_data_filepath)
+        else:
+            gripper_df = pd.read_csv(gripper_data_filepath, usecols=list(required_columns), dtype=required_columns)
         return self.call(gripper_df)
 
     # a wrapper for __call__
@@ -44,6 +70,16 @@ class MinExtractor(PolarisMotorDataExtractor):
     """Extracts the motor record with min motor_2 value, polaris record with min z value
     """
 
+    def __init__(self, polaris_columns=None):
+        """
+        :param polaris_columns: polaris columns of gripper data, POLARIS_COLUMNS by default, see polaris_columns_of
+        """
+        self.polaris_columns = list(polaris_columns) if polaris_columns is not None else POLARIS_COLUMNS
+
+    @property
+    def required_columns(self):
+        return {c: np.float64 for c in MOTOR_COLUMNS + self.polaris_columns}
+
     def call(self, gripper_df):
         # extract motor record with min motor_2
         motor_df = gripper_df[['gripper_motor_1', 'gripper_motor_2', 'gripper_motor_3', 'gripper_motor_4']]
@@ -51,7 +87,7 @@ class MinExtractor(PolarisMotorDataExtractor):
         motor_record = motor_df.iloc[min_motor2_ind]
 
         # extract polaris record with min z
-        polaris_df = gripper_df[['polaris_x', 'polaris_y', 'polaris_z', 'polaris_rx', 'polaris_ry',	'polaris_rz']]
+        polaris_df = gripper_df[self.polaris_columns]
         min_z_ind = np.argmin(polaris_df['polaris_z'])
         polaris_record = polaris_df.iloc[min_z_ind]
 
@@ -61,5 +97,85 @@ class MinExtractor(PolarisMotorDataExtractor):
         return merged
 
 
+class WindowStatsExtractor(PolarisMotorDataExtractor):
+    """Extracts mean, min, max and slope of motor and polaris columns in windows around the grasp closure point,
+    i.e. the record with min motor_2 value, windows are centered at the closure point shifted by each offset,
+    window sizes and offsets are counted in records and slopes are per record
+
+    rolling statistics are computed for all records at once, means and slopes by cumulative sums
+    and min and max by running filters, so the cost is O(N) per window size regardless of its width
+    """
+
+    STATS = ('mean', 'min', 'max', 'slope')
+
+    def __init__(self, window_sizes=(5, 11, 21), offsets=(-10, 0, 10), columns=None, polaris_columns=None):
+        """
+        :param window_sizes: odd window sizes in number of records
+        :param offsets: offsets of window centers from the closure point in number of records
+        :param columns: columns to extract statistics from, all motor and polaris columns by default
+        :param polaris_columns: polaris columns of gripper data, POLARIS_COLUMNS by default, see polaris_columns_of
+        """
+        if any(w < 1 or w % 2 == 0 for w in window_sizes):
+            raise ValueError('window sizes must be positive odd numbers, got {}'.format(window_sizes))
+
+        self.window_sizes = tuple(window_sizes)
+        self.offsets = tuple(offsets)
+        if columns is None:
+            columns = MOTOR_COLUMNS + (list(polaris_columns) if polaris_columns is not None else POLARIS_COLUMNS)
+        self.columns = list(columns)
+
+    @property
+    def required_columns(self):
+        # motor_2 locates the closure point
+        return {c: np.float64 for c in self.columns + ['gripper_motor_2']}
+
+    @property
+    def feature_names(self):
+        return ['{}_w{}_o{}_{}'.format(c, w, o, stat)
+                for w in self.window_sizes for o in self.offsets for stat in self.STATS for c in self.columns]
+
+    def call(self, gripper_df):
+        values = gripper_df[self.columns].values.astype(np.float64)  # a nxm matrix
+        n = len(values)
+        closure_ind = np.argmin(gripper_df['gripper_motor_2'].values)
+        centers = np.clip(closure_ind + np.array(self.offsets), 0, n - 1)
+
+        # prefix sums of y, k*y, k and k^2 where k is the record index, prepended with a zero row
+        k = np.arange(n, dtype=np.float64)
+        cum_y = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+        cum_ky = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(k[:, None] * values, axis=0)])
+        cum_k = np.concatenate([[0.0], np.cumsum(k)])
+        cum_kk = np.concatenate([[0.0], np.cumsum(k * k)])
+
+        features = []
+        for w in self.window_sizes:
+            half = w // 2
+            # windows are truncated at both ends of the recording
+            lo = np.clip(centers - half, 0, n)
+            hi = np.clip(centers + half + 1, 0, n)
+            counts = (hi - lo).astype(np.float64)[:, None]
+
+            sum_y = cum_y[hi] - cum_y[lo]
+            sum_ky = cum_ky[hi] - cum_ky[lo]
+            sum_k = (cum_k[hi] - cum_k[lo])[:, None]
+            sum_kk = (cum_kk[hi] - cum_kk[lo])[:, None]
+
+            mean = sum_y / counts
+            # least squares slope of y against k
+            s_xx = sum_kk - sum_k * sum_k / counts
+            s_xy = sum_ky - sum_k * sum_y / counts
+            slope = np.divide(s_xy, s_xx, out=np.zeros_like(s_xy), where=s_xx > 0)
+
+            # edge replication pads with values inside the window, so truncated windows come for free
+            window_min = minimum_filter1d(values, size=w, axis=0, mode='nearest')[centers]
+            window_max = maximum_filter1d(values, size=w, axis=0, mode='nearest')[centers]
+
+            # a len(offsets) x len(STATS) x m block, in the order of feature_names
+            features.append(np.stack([mean, window_min, window_max, slope], axis=1))
+
+        return dict(zip(self.feature_names, np.concatenate(features, axis=0).ravel()))
+
+
 # register extractors
-PolarisMotorDataExtractor.register_extractor('min_extractor', MinExtractor)
\ No newline at end of file
+PolarisMotorDataExtractor.register_extractor('min_extractor', MinExtractor)
+PolarisMotorDataExtractor.register_extractor('window_stats_extractor', WindowStatsExtractor)
\ No newline at end of file